@@ -1,44 +1,120 @@
-from flask import Flask, jsonify
+from flask import Flask, jsonify, Response, stream_with_context, g
 from flask_cors import CORS
 from dotenv import load_dotenv
-import psycopg2
 import requests
 from flask import request, jsonify
 from datetime import datetime, timedelta
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
 from urllib.parse import urlencode
-import zoneinfo
-from datetime import timezone # Use UTC for start_ms and end_ms
 import os   
 from utils import clover_time_handler
+from utils import db
+from utils import sync_state
+from utils import shift_queries
+from utils import staged_queries
+from utils import shift_export
+from utils import hours_summary
+from utils import promotion
+from utils import shift_checks
+from utils import coverage
+from utils import migrations
+from utils import serialization
+from utils import metrics
+from utils.metrics import log_event, timed
+from utils.rate_limit import TokenBucket
+from utils.cache import TTLCache
+from utils.sync_jobs import JobRunner
+from utils.clover_webhook import WebhookBatcher
+from utils import clover_webhook
+from utils.shift_normalizer import normalize_clover_shifts, shift_times
+from utils.clover_client import CloverClient, CloverAPIError, UnsupportedFilterError, CLOVER_BASE_URL, SHIFT_MODIFIED_FIELD
+from concurrent.futures import ThreadPoolExecutor
+import queue
+import threading
+import hashlib
+import itertools
+import time
 
 load_dotenv()
 
 app = Flask(__name__)
+app.json = serialization.JSONProvider(app)  # orjson when installed, same output as Flask's
 CORS(app)  # Allows frontend (Vercel) to access backend
 
-CLOVER_BASE_URL = "https://api.clover.com/v3/merchants"
 CLOVER_MERCHANT_ID = os.getenv("MERCHANT_ID")
 CLOVER_ACCESS_TOKEN = os.getenv("AUTHORIZATION_TOKEN")  # or load from .env
 
+# Bulk sync fans Clover calls out over a small worker pool. Clover limits each
+# merchant token to ~16 requests/sec, so every worker shares one token bucket.
+CLOVER_FETCH_CONCURRENCY = int(os.getenv("CLOVER_FETCH_CONCURRENCY", "5"))
+CLOVER_PAGE_QUEUE_DEPTH = 2  # pages a bulk-sync worker may fetch ahead of the DB writer
+# Bulk sync skips employees whose watermark was advanced less than this many seconds ago
+CLOVER_SYNC_MIN_INTERVAL = float(os.getenv("CLOVER_SYNC_MIN_INTERVAL", "300"))
+clover_rate_limiter = TokenBucket(
+    rate=float(os.getenv("CLOVER_RATE_LIMIT", "16")),
+    capacity=float(os.getenv("CLOVER_RATE_BURST", "16")),
+)
+
+# One pooled keep-alive session for every Clover call in this process
+clover_client = CloverClient(
+    CLOVER_MERCHANT_ID,
+    CLOVER_ACCESS_TOKEN,
+    base_url=os.getenv("CLOVER_BASE_URL", CLOVER_BASE_URL),  # e.g. benchmarks/fake_clover.py locally
+    timeout=(float(os.getenv("CLOVER_CONNECT_TIMEOUT", "5")), float(os.getenv("CLOVER_READ_TIMEOUT", "30"))),
+    max_retries=int(os.getenv("CLOVER_MAX_RETRIES", "4")),
+    # Enough keep-alive connections for the bulk workers plus concurrent single fetches
+    pool_maxsize=max(CLOVER_FETCH_CONCURRENCY, int(os.getenv("CLOVER_HTTP_POOL_SIZE", "16"))),
+    rate_limiter=clover_rate_limiter,
+)
+
 # Establish connection
-def get_db_connection():
-    conn = psycopg2.connect(os.getenv("DATABASE_URL"))
-    return conn
+# Connections come from the process-wide pool in utils/db.py; use as
+# `with get_db_connection() as conn:` so they are always handed back.
+get_db_connection = db.connection
+
+# --- Instrumentation ---
+# Every route is timed into http_request_duration_seconds and logged as one
+# structured line; DB statements and Clover calls are timed in utils.db and
+# utils.clover_client. Streamed bodies are sent after this hook runs.
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        elapsed = time.perf_counter() - started
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.HTTP_REQUEST_SECONDS.observe(elapsed, method=request.method, route=route, status=str(response.status_code))
+        if route != "/metrics":
+            log_event("request", method=request.method, route=route, status=response.status_code,
+                      duration_ms=round(elapsed * 1000, 1))
+    return response
+
+# gzip/brotli for sizeable JSON and CSV bodies, per Accept-Encoding
+@app.after_request
+def compress_response(response):
+    return serialization.compress_response(response, request.headers.get("Accept-Encoding"))
+
+@app.route("/metrics")
+def get_metrics():
+    return Response(metrics.REGISTRY.render(), mimetype="text/plain; version=0.0.4")
 
 # --- Test Route ---
 @app.route("/ping")
 def ping():
     return jsonify({"message": "pong"})
 
+# --- DB pool stats (in use / idle / wait time) for sizing gunicorn workers ---
+@app.route("/api/db-pool-stats", methods=["GET"])
+def get_db_pool_stats():
+    return jsonify(db.pool_stats() or {"status": "pool not initialised"})
+
 @app.route('/api/shifts-of-employee', methods=['GET'])
 def get_shifts_of_employee():
     clover_emp_id = 'H776EYJH0M2FY'
-    clover_url = f"https://api.clover.com/v3/merchants/{CLOVER_MERCHANT_ID}/employees/{clover_emp_id}/shifts"
-    headers = {
-        "Authorization": f"Bearer {CLOVER_ACCESS_TOKEN}",
-        "Accept": "application/json"
-    }
+    clover_url = clover_client.url(f"employees/{clover_emp_id}/shifts")
     params = [
         ("expand", "employee"),
         ("filter", "has_in_time=true"),
@@ -49,405 +125,689 @@ def get_shifts_of_employee():
     # Log the full URL
     query_string = urlencode(params, doseq=True)
     full_url = f"{clover_url}?{query_string}"
-    print(f"Sending request to: {full_url}")
+    log_event("clover.request", url=full_url)
     
     try:
-        response = requests.get(clover_url, headers=headers, params=params)
-        print(f"Status Code: {response.status_code}")
-        print(f"Response: {response.text}")
+        response = clover_client.get(f"employees/{clover_emp_id}/shifts", params=params)
+        log_event("clover.response", status=response.status_code, bytes=len(response.content))
         return jsonify({
             "status_code": response.status_code,
             "data": response.json()
         })
     except requests.RequestException as e:
-        print(f"Error: {e}")
+        log_event("clover.error", level="error", url=full_url, error=str(e))
         return jsonify({"error": str(e)}), 500
 
 @app.route("/api/fetch-clover-shifts", methods=["POST"])
 def fetch_clover_shifts():
     try:
-        print("=== Clover Shift Fetch Started ===")
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-
-        # Get employee_id from request
-        data = request.json
-        employee_id = data.get("employee_id")
-        if not employee_id:
-            print("Missing employee_id in request")
-            return jsonify({"error": "employee_id is required"}), 400
-        print(f"Fetching shifts for employee_id: {employee_id}")
-
-        # Step 1: Get Clover employee ID
-        try:
-            cursor.execute(
-                "SELECT clover_employee_id FROM tbc.clover_employee_map WHERE employee_id = %s",
-                (employee_id,))
-            row = cursor.fetchone()
-            if not row:
-                print("No Clover mapping found for employee")
-                return jsonify({"error": "Clover employee mapping not found"}), 404
-            clover_emp_id = row["clover_employee_id"]
-            print(f"Found Clover employee ID: {clover_emp_id}")
-        except Exception as map_err:
-            print("Error fetching Clover employee mapping:", map_err)
-            raise
-        
-        # Step 2: Get employee role from tbc.employees
-        try:
-            cursor.execute(
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            # Get employee_id from request
+            data = request.json
+            employee_id = data.get("employee_id")
+            if not employee_id:
+                return jsonify({"error": "employee_id is required"}), 400
+
+            # Step 1: Get Clover employee ID, role and sync window in one query
+            try:
+                migrations.ensure_schema(conn)
+                cursor.execute(
+                    EMPLOYEE_SYNC_WINDOWS_QUERY.format(where="cem.employee_id = %(employee_id)s"),
+                    {"employee_id": employee_id, "min_interval": CLOVER_SYNC_MIN_INTERVAL, "mode": "window",
+                     "use_watermark": False})
+                row = cursor.fetchone()
+                if not row:
+                    log_event("clover_fetch.unmapped", level="warning", employee_id=employee_id)
+                    return jsonify({"error": "Clover employee mapping not found"}), 404
+                clover_emp_id = row["clover_employee_id"]
                 # IMPORTANT: Role (Front or Back) is used as work_area in Clover shifts
-                "SELECT role FROM tbc.employees WHERE id = %s",
-                (employee_id,))
-            row = cursor.fetchone()
-            if not row:
-                print("No employee found for employee_id")
-                return jsonify({"error": "Employee not found"}), 404
-            work_area = row["role"]
-            print(f"Employee role (work_area): {work_area}")
-        except Exception as role_err:
-            print("Error fetching employee role:", role_err)
-            raise
-
-        # Step 3: Determine date range to fetch
-        try:
-            cursor.execute(
-                "SELECT MAX(shift_date) FROM tbc.shifts_dummy_20250719 WHERE employee_id = %s",
-                (employee_id,))
-            max_date_row = cursor.fetchone()
-            start_date = (max_date_row["max"] or datetime.today().date() - timedelta(days=7)) + timedelta(days=1)
-            end_date = datetime.today().date()
-            print(f"Fetching data from Clover between {start_date} and {end_date}")
-        except Exception as date_err:
-            print("Error determining date range:", date_err)
-            raise
-
-        # Convert to milliseconds for Clover API ('start of day' to 'end of today' ensuring the latest shifts are included)
-        start_ms = clover_time_handler.readable_to_epoch(start_date.isoformat(), "start")
-        end_ms = clover_time_handler.readable_to_epoch(end_date.isoformat(), "end")
-
-        print(f"Fetching from PST {start_ms}")
-        print(f"Fetching to PST {end_ms}")
-
-        # Step 4: Fetch from Clover
-        clover_url = f"{CLOVER_BASE_URL}/{CLOVER_MERCHANT_ID}/employees/{clover_emp_id}/shifts"
-        headers = {
-            "Authorization": f"Bearer {CLOVER_ACCESS_TOKEN}",
-            "Accept": "application/json"
-        }
-        params = [
-            ("limit", 1000),  # Make sure all possible records are returned [Default limit is 100 records]
-            ("expand", "employee"),
-            ("filter", "has_in_time=true"),
-            ("filter", f"in_and_override_time>{start_ms}"),
-            ("filter", f"in_and_override_time<{end_ms}")
-        ]
-        print(f"Sending request to Clover API...\nURL: {clover_url}\nParams: {params}")
-        response = requests.get(clover_url, headers=headers, params=params)
-        
-        if response.status_code != 200:
-            print(f"Clover API failed with status {response.status_code}")
-            print("Response:", response.text)
-            return jsonify({"error": "Failed to fetch from Clover", "details": response.text}), 500
-
-        clover_shifts = response.json().get("elements", [])
-        print(f"Fetched {len(clover_shifts)} shifts from Clover")
-        pacific = zoneinfo.ZoneInfo("America/Los_Angeles")
+                work_area = row["role"]
+            except Exception as map_err:
+                log_event("clover_fetch.mapping_error", level="error", employee_id=employee_id, error=str(map_err))
+                raise
+
+        # The DB connection is back in the pool from here on: a slow Clover response
+        # must not hold one while other requests wait for it
+        # Step 2: Determine range to fetch: from the day after the last promoted shift to
+        # the end of today (ensuring the latest shifts are included). Not from the bulk
+        # watermark: shifts a bulk sync staged but nobody promoted yet belong in the preview.
+        start_ms = sync_start_ms(row, use_watermark=False)
+        end_ms = clover_time_handler.readable_to_epoch(datetime.today().date().isoformat(), "end")
+
+        # Step 3: Fetch from Clover
         preview_data = []
-        for shift in clover_shifts:
-            try:
-                in_ms = shift.get("overrideInTime") or shift.get("inTime")
-                out_ms = shift.get("overrideOutTime") or shift.get("outTime")
-                in_ts = datetime.fromtimestamp(in_ms / 1000, tz=pacific)
-                out_ts = datetime.fromtimestamp(out_ms / 1000, tz=pacific)
-                shift_date = in_ts.date()
-                time_in = in_ts.strftime("%H:%M:00") # Ensures time_in is in HH:MM:00 format
-                time_out = out_ts.strftime("%H:%M:00") # Ensures time_out is in HH:MM:00 format
-                
-                # Calculate decimal_hours using only hours and minutes
-                hours = out_ts.hour - in_ts.hour
-                minutes = out_ts.minute - in_ts.minute
-                decimal_hours = round(hours + minutes / 60, 2)
-                shift_label = determine_shift_label(in_ts.time())
-
-                preview_data.append({
-                    "employee_id": employee_id,
-                    "shift_date": str(shift_date),
-                    "time_in": time_in,
-                    "time_out": time_out,
-                    "work_area": work_area,  # Use role from tbc.employees
-                    "shift_label": shift_label,
-                    "decimal_hours": decimal_hours,
-                    "notes": ""
-                })
-            except Exception as parse_err:
-                print("Failed to parse shift record:", parse_err)
-        
+        fetched = 0
+        fetch_started = time.perf_counter()
+        try:
+            # Pages stream in lazily; the next one downloads while this one is parsed
+            for clover_shifts in clover_client.iter_shift_pages(clover_emp_id, start_ms, end_ms):
+                fetched += len(clover_shifts)
+                normalized, _ = normalize_clover_shifts(clover_shifts)
+                for shift in normalized:
+                    preview_data.append({
+                        "employee_id": employee_id,
+                        "shift_date": str(shift["shift_date"]),
+                        "time_in": shift["time_in"],
+                        "time_out": shift["time_out"],
+                        "work_area": work_area,  # Use role from tbc.employees
+                        "shift_label": shift["shift_label"],
+                        "decimal_hours": shift["decimal_hours"],
+                        "notes": ""
+                    })
+        except CloverAPIError as api_err:
+            log_event("clover_fetch.clover_error", level="error", employee_id=employee_id,
+                      status=api_err.status_code, response=api_err.text[:500])
+            return jsonify({"error": "Failed to fetch from Clover", "details": api_err.text}), 500
+        log_event("clover_fetch", employee_id=employee_id, clover_employee_id=clover_emp_id, work_area=work_area,
+                  start_ms=start_ms, end_ms=end_ms, fetched=fetched,
+                  duration_ms=round((time.perf_counter() - fetch_started) * 1000, 1))
+
         # Sort preview_data by shift_date in ascending order
         preview_data = sorted(preview_data, key=lambda x: datetime.strptime(x["shift_date"], "%Y-%m-%d").date())
 
         return jsonify({"status": "success", "preview": preview_data})
 
     except Exception as e:
-        print("ERROR IN /api/fetch-clover-shifts:", e)
+        log_event("route.error", level="error", route="/api/fetch-clover-shifts", error=str(e))
         return jsonify({"error": "Internal Server Error"}), 500
 
-    finally:
+# Clover-mapped employees with their sync watermark, and whether a %(mode)s sync ran
+# for them within %(min_interval)s seconds. The MAX(shift_date) fallback is
+# only evaluated for employees that have never been synced, or for every employee
+# when %(use_watermark)s is false (the single-employee preview).
+EMPLOYEE_SYNC_WINDOWS_QUERY = """
+    SELECT e.id AS employee_id, cem.clover_employee_id, e.role, e.preferred_name,
+           st.last_synced_ms, st.last_modified_ms,
+           COALESCE(CASE WHEN %(mode)s = 'delta' THEN st.delta_synced_at ELSE st.synced_at END
+                    > now() - make_interval(secs => %(min_interval)s), FALSE) AS recently_synced,
+           last_shift.max_shift_date
+    FROM tbc.clover_employee_map cem
+    JOIN tbc.employees e ON cem.employee_id = e.id
+    LEFT JOIN tbc.sync_state st ON st.clover_employee_id = cem.clover_employee_id
+    LEFT JOIN LATERAL (
+        SELECT MAX(s.shift_date) AS max_shift_date
+        FROM tbc.shifts_dummy_20250719 s
+        WHERE s.employee_id = e.id AND (st.last_synced_ms IS NULL OR NOT %(use_watermark)s)
+    ) last_shift ON TRUE
+    WHERE {where}
+"""
+
+def sync_start_ms(emp, use_watermark=True):
+    # Resume from the stored watermark; otherwise start the day after the last promoted shift
+    if use_watermark and emp["last_synced_ms"] is not None:
+        return emp["last_synced_ms"]
+    start_date = (emp["max_shift_date"] or datetime.today().date() - timedelta(days=7)) + timedelta(days=1)
+    return clover_time_handler.readable_to_epoch(start_date.isoformat(), "start")
+
+
+# Dedup key is (employee_id, shift_date, time_in, time_out, clover_shift_id);
+# rows repeated inside one batch are dropped by DO NOTHING as well
+STAGED_SHIFTS_INSERT = """
+    INSERT INTO tbc.staged_shifts (
+        employee_id, clover_shift_id, shift_date, time_in, time_out,
+        work_area, shift_label, decimal_hours
+    ) VALUES %s
+    ON CONFLICT (employee_id, shift_date, time_in, time_out, clover_shift_id) DO NOTHING
+    RETURNING id
+"""
+
+def insert_staged_shifts(cursor, rows):
+    # Write all rows in a single statement and return the ids that were actually inserted
+    if not rows:
+        return []
+    return execute_values(cursor, STAGED_SHIFTS_INSERT, rows, page_size=len(rows), fetch=True)
+
+# Delta sync upsert, keyed on clover_shift_id: new shifts are inserted, staged rows whose
+# times changed in Clover are updated in place. A changed row that was already promoted
+# is updated too and flagged needs_review, since tbc.shifts_dummy_20250719 still holds
+# the old times.
+#
+# Window syncs key on the clock times, so a shift edited in Clover can already have
+# several staged rows. Only one of them is updated: the row that already holds the
+# incoming times if there is one (updating another to those times would break the
+# unique key), otherwise the newest. The other unpromoted versions are stale and are
+# deleted; promoted ones are left as the record of what was promoted.
+STAGED_SHIFTS_UPSERT = """
+    WITH incoming (
+        employee_id, clover_shift_id, shift_date, time_in, time_out,
+        work_area, shift_label, decimal_hours, clover_modified_ms
+    ) AS (
+        VALUES %s
+    ),
+    target AS (
+        SELECT DISTINCT ON (ss.clover_shift_id) ss.id, ss.clover_shift_id
+        FROM tbc.staged_shifts ss
+        JOIN incoming i ON ss.clover_shift_id = i.clover_shift_id
+        ORDER BY ss.clover_shift_id,
+                 (ss.employee_id, ss.shift_date, ss.time_in, ss.time_out)
+                     = (i.employee_id, i.shift_date, i.time_in, i.time_out) DESC,
+                 ss.id DESC
+    ),
+    changed AS (
+        UPDATE tbc.staged_shifts ss
+        SET shift_date = i.shift_date,
+            time_in = i.time_in,
+            time_out = i.time_out,
+            shift_label = i.shift_label,
+            decimal_hours = i.decimal_hours,
+            clover_modified_ms = i.clover_modified_ms,
+            needs_review = ss.needs_review OR ss.is_promoted,
+            staged_at = now()
+        FROM target t
+        JOIN incoming i ON i.clover_shift_id = t.clover_shift_id
+        WHERE ss.id = t.id
+          AND (ss.shift_date, ss.time_in, ss.time_out, ss.decimal_hours)
+              IS DISTINCT FROM (i.shift_date, i.time_in, i.time_out, i.decimal_hours)
+        RETURNING ss.is_promoted
+    ),
+    superseded AS (
+        DELETE FROM tbc.staged_shifts ss
+        USING target t
+        WHERE ss.clover_shift_id = t.clover_shift_id AND ss.id <> t.id AND NOT ss.is_promoted
+        RETURNING ss.id
+    ),
+    added AS (
+        INSERT INTO tbc.staged_shifts (
+            employee_id, clover_shift_id, shift_date, time_in, time_out,
+            work_area, shift_label, decimal_hours, clover_modified_ms
+        )
+        SELECT i.employee_id, i.clover_shift_id, i.shift_date, i.time_in, i.time_out,
+               i.work_area, i.shift_label, i.decimal_hours, i.clover_modified_ms
+        FROM incoming i
+        WHERE NOT EXISTS (SELECT 1 FROM tbc.staged_shifts ss WHERE ss.clover_shift_id = i.clover_shift_id)
+        ON CONFLICT (employee_id, shift_date, time_in, time_out, clover_shift_id) DO NOTHING
+        RETURNING id
+    )
+    SELECT (SELECT COUNT(*) FROM added) AS inserted,
+           (SELECT COUNT(*) FROM changed WHERE NOT is_promoted) AS updated,
+           (SELECT COUNT(*) FROM changed WHERE is_promoted) AS flagged
+"""
+STAGED_SHIFTS_UPSERT_TEMPLATE = "(%s, %s, %s::date, %s::time, %s::time, %s, %s, %s::numeric, %s::bigint)"
+
+def upsert_staged_shifts(cursor, rows):
+    """Upsert delta-sync rows (STAGED_SHIFTS_INSERT columns + clover_modified_ms).
+
+    Returns {"inserted", "updated", "flagged"} counts; unchanged rows count in none.
+    """
+    if not rows:
+        return {"inserted": 0, "updated": 0, "flagged": 0}
+    # A shift edited twice between syncs can show up twice; keep the latest version
+    latest = {}
+    for row in rows:
+        latest[row[1]] = row
+    rows = list(latest.values())
+    result = execute_values(cursor, STAGED_SHIFTS_UPSERT, rows, template=STAGED_SHIFTS_UPSERT_TEMPLATE,
+                            page_size=len(rows), fetch=True)[0]
+    return {key: result[key] for key in ("inserted", "updated", "flagged")}
+
+
+def stream_clover_pages(executor, clover_pages, stop):
+    """Run a CloverClient page iterator on `executor`; return (generator of its pages, cancel).
+
+    Pages travel through a small bounded queue, so a worker that gets ahead of the
+    writer blocks instead of buffering a whole backfill in memory. Setting `stop`
+    (every stream) or calling `cancel()` (this one, e.g. after its employee failed)
+    releases a worker still waiting to hand over a page, so it frees its executor
+    slot for the employees queued behind it.
+    """
+    pages = queue.Queue(maxsize=CLOVER_PAGE_QUEUE_DEPTH)
+    cancelled = threading.Event()
+    done = object()
+
+    def put(item):
+        while not (stop.is_set() or cancelled.is_set()):
+            try:
+                pages.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def finish(item):
+        # The end of the stream always goes in. Once the writer has stopped reading,
+        # the pages still queued are dropped to make room for it.
+        if put(item):
+            return
+        while True:
+            try:
+                pages.get_nowait()
+            except queue.Empty:
+                break
+        pages.put_nowait(item)
+
+    def worker():
+        # Runs on a worker thread: Clover HTTP only, no DB access
         try:
-            cursor.close()
-            conn.close()
-        except:
-            pass
+            for page in clover_pages:
+                if not put(page):
+                    break
+            finish(done)
+        except Exception as e:
+            finish(e)
 
-def determine_shift_label(time_obj):
-    # Uses current logic from earlier conversation
-    if time_obj < datetime.strptime("14:30", "%H:%M").time():
-        return "Lunch"
-    elif time_obj < datetime.strptime("17:00", "%H:%M").time():
-        return "Break"
-    else:
-        return "Dinner"
+    future = executor.submit(worker)
 
+    def consume():
+        while True:
+            try:
+                item = pages.get(timeout=0.5)
+            except queue.Empty:
+                if future.done() and pages.empty():
+                    # Never ran (executor shut down) or ended without a word
+                    raise RuntimeError("Clover page worker exited without finishing its stream")
+                continue
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
 
-@app.route('/api/fetch-clover-shifts-bulk', methods=['POST'])
-def fetch_clover_shifts_bulk():
-    try:
-        print("=== Bulk Clover Shift Fetch Started ===")
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
+    return consume(), cancelled.set
 
-        # Step 1: Get all active employees with Clover mapping
-        cursor.execute("""
-            SELECT e.id AS employee_id, cem.clover_employee_id, e.role, e.preferred_name
-            FROM tbc.clover_employee_map cem
-            JOIN tbc.employees e ON cem.employee_id = e.id
-            WHERE e.is_active = TRUE
-        """)
-        employee_map = cursor.fetchall()
-        pacific = zoneinfo.ZoneInfo("America/Los_Angeles")
-
-        imported = 0
-        skipped = 0
-        errors = []
 
+# Bulk syncs run on a background thread; the request only queues one and
+# returns its id for polling at /api/sync-jobs/<id>
+sync_jobs = JobRunner()
+
+def clover_delta_supported(employees):
+    # Probe employees until one can tell (see CloverClient.probe_modified_filter);
+    # with no shifts anywhere there is nothing to download either way
+    for emp in employees:
+        try:
+            supported = clover_client.probe_modified_filter(emp["clover_employee_id"])
+        except CloverAPIError as api_err:
+            log_event("clover.modified_filter", level="warning", clover_employee_id=emp["clover_employee_id"],
+                      status=api_err.status_code, error=api_err.text[:500])
+            continue
+        if supported is not None:
+            return supported
+    return True
+
+def run_bulk_sync(job):
+    with timed("bulk_sync", job_id=job.id, mode=job.params["mode"]) as summary, \
+            get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+        # Step 1: Get all active employees with Clover mapping and their sync watermark
+        migrations.ensure_schema(conn)
+        mode = job.params["mode"]
+
+        def load_employees():
+            cursor.execute(
+                EMPLOYEE_SYNC_WINDOWS_QUERY.format(where="e.is_active = TRUE"),
+                {"min_interval": CLOVER_SYNC_MIN_INTERVAL, "mode": mode, "use_watermark": True})
+            return cursor.fetchall()
+
+        employee_map = load_employees()
+        if mode == "delta" and not clover_delta_supported(employee_map):
+            # Clover ignores the modifiedTime filter, so a delta walk would download
+            # every employee's whole history: sync by clock-in window instead
+            log_event("bulk_sync.delta_unsupported", level="warning", job_id=job.id)
+            mode = job.params["mode_used"] = "window"
+            employee_map = load_employees()
+
+        # Step 2: Determine the window to fetch for every employee up front, so the
+        # worker threads never touch the (non thread-safe) cursor
+        end_ms = clover_time_handler.readable_to_epoch(job.params["sync_date"], "end")
+        delta = mode == "delta"
+        windows = []
         for emp in employee_map:
             employee_id = emp["employee_id"]
-            clover_emp_id = emp["clover_employee_id"]
-            work_area = emp["role"]
             preferred_name = emp.get("preferred_name", "")
-            
-            print(f"Fetching shifts for employee_id: {employee_id} ({preferred_name})")
-
-            # Step 2: Determine date range to fetch
-            try:
-                cursor.execute(
-                    "SELECT MAX(shift_date) FROM tbc.shifts_dummy_20250719 WHERE employee_id = %s",
-                    (employee_id,))
-                max_date_row = cursor.fetchone()
-                start_date = (max_date_row["max"] or datetime.today().date() - timedelta(days=7)) + timedelta(days=1)
-                end_date = datetime.today().date()
-                print(f"Fetching data from Clover between {start_date} and {end_date} for employee {employee_id}")
-            except Exception as date_err:
-                print("Error determining date range:", date_err)
-                raise
+            if emp["recently_synced"] and not job.params["force"]:
+                job.add_employee(employee_id, preferred_name, status="up_to_date")
+                continue
+            job.add_employee(employee_id, preferred_name)
+            start_ms = sync_start_ms(emp)
+            if delta:
+                # First delta run for an employee starts from its window start
+                modified_since = emp["last_modified_ms"] or start_ms
+                clover_pages = clover_client.iter_modified_shift_pages(emp["clover_employee_id"], modified_since, prefetch=False)
+            else:
+                modified_since = None
+                clover_pages = clover_client.iter_shift_pages(emp["clover_employee_id"], start_ms, end_ms, prefetch=False)
+            windows.append((emp, start_ms, modified_since, clover_pages))
 
-            # Convert to milliseconds for Clover API
-            start_ms = clover_time_handler.readable_to_epoch(start_date.isoformat(), "start")
-            end_ms = clover_time_handler.readable_to_epoch(end_date.isoformat(), "end")
-
-            # Step 3: Fetch from Clover
-            clover_url = f"{CLOVER_BASE_URL}/{CLOVER_MERCHANT_ID}/employees/{clover_emp_id}/shifts"
-            headers = {
-                "Authorization": f"Bearer {CLOVER_ACCESS_TOKEN}",
-                "Accept": "application/json"
-            }
-            params = [
-                ("limit", 1000),  # Make sure all possible records are returned [Default limit is 100 records]
-                ("expand", "employee"),
-                ("filter", "has_in_time=true"),
-                ("filter", f"in_and_override_time>{start_ms}"),
-                ("filter", f"in_and_override_time<{end_ms}")
-            ]
+        # Step 3: Fetch from Clover on a bounded worker pool (rate limited per merchant).
+        # This thread is the single writer: pages are consumed in employee order so
+        # DB writes stay ordered while the remaining fetches are still in flight.
+        stop = threading.Event()
+        with ThreadPoolExecutor(max_workers=CLOVER_FETCH_CONCURRENCY) as executor:
             try:
-                response = requests.get(clover_url, headers=headers, params=params)
-                if response.status_code != 200:
-                    print(f"Failed for employee {employee_id}: {response.status_code}")
-                    errors.append({"employee_id": employee_id, "error": response.text})
-                    continue
-
-                clover_shifts = response.json().get("elements", [])
-                for shift in clover_shifts:
+                streams = [
+                    (emp, start_ms, modified_since, *stream_clover_pages(executor, clover_pages, stop))
+                    for emp, start_ms, modified_since, clover_pages in windows
+                ]
+                for emp, start_ms, modified_since, pages, cancel_pages in streams:
+                    employee_id = emp["employee_id"]
+                    work_area = emp["role"]
+                    counts = {"imported": 0, "skipped": 0, "updated": 0, "flagged": 0}
+                    tracker = sync_state.WatermarkTracker(start_ms)
+                    last_modified_ms = modified_since
+                    job.update_employee(employee_id, status="running")
+                    employee_started = time.perf_counter()
                     try:
-                        in_ms = shift.get("overrideInTime") or shift.get("inTime")
-                        out_ms = shift.get("overrideOutTime") or shift.get("outTime")
-                        if not in_ms or not out_ms:
-                            skipped += 1
-                            continue
-                        in_ts = datetime.fromtimestamp(in_ms / 1000, tz=pacific)
-                        out_ts = datetime.fromtimestamp(out_ms / 1000, tz=pacific)
-                        shift_date = in_ts.date()
-                        time_in = in_ts.strftime("%H:%M:00")
-                        time_out = out_ts.strftime("%H:%M:00")
-                        hours = out_ts.hour - in_ts.hour
-                        minutes = out_ts.minute - in_ts.minute
-                        decimal_hours = round(hours + minutes / 60, 2)
-                        shift_label = determine_shift_label(in_ts.time())
-                        clover_shift_id = shift.get("id")
-
-                        # Insert into staged_shifts, avoid duplicates
-                        insert_query = """
-                            INSERT INTO tbc.staged_shifts (
-                                employee_id, clover_shift_id, shift_date, time_in, time_out,
-                                work_area, shift_label, decimal_hours
-                            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                            ON CONFLICT (employee_id, shift_date, time_in, time_out, clover_shift_id) DO NOTHING
-                        """
-                        cursor.execute(insert_query, (
-                            employee_id,
-                            clover_shift_id,
-                            shift_date,
-                            time_in,
-                            time_out,
-                            work_area,
-                            shift_label,
-                            decimal_hours
-                        ))
-                        if cursor.rowcount == 1:
-                            imported += 1
-                        else:
-                            skipped += 1
-                    except Exception as parse_err:
-                        print(f"Failed to parse/insert shift for employee {employee_id}: {parse_err}")
-                        errors.append({"employee_id": employee_id, "error": str(parse_err)})
-                        skipped += 1
-                conn.commit()
-            except Exception as e:
-                print(f"Error fetching/inserting for employee {employee_id}: {e}")
-                errors.append({"employee_id": employee_id, "error": str(e)})
-                continue
+                        for clover_shifts in pages:
+                            modified = {}
+                            for shift in clover_shifts:
+                                tracker.add(*shift_times(shift))
+                                modified[shift.get("id")] = shift.get(SHIFT_MODIFIED_FIELD)
+                            normalized, page_skipped = normalize_clover_shifts(clover_shifts)
+                            counts["skipped"] += page_skipped
+                            rows = [
+                                (
+                                    employee_id,
+                                    shift["clover_shift_id"],
+                                    shift["shift_date"],
+                                    shift["time_in"],
+                                    shift["time_out"],
+                                    work_area,
+                                    shift["shift_label"],
+                                    shift["decimal_hours"]
+                                )
+                                for shift in normalized
+                            ]
 
-        # --- Fetch all staged shifts that have not been promoted ---
-        cursor.execute("""
-            SELECT 
-                ss.id,
-                ss.employee_id,
-                e.preferred_name,
-                ss.clover_shift_id,
-                ss.shift_date,
-                ss.time_in,
-                ss.time_out,
-                ss.work_area,
-                ss.shift_label,
-                ss.decimal_hours,
-                ss.notes
-            FROM tbc.staged_shifts ss
-            JOIN tbc.employees e ON ss.employee_id = e.id
-            WHERE ss.is_promoted = FALSE
-            ORDER BY ss.shift_date ASC, ss.time_in ASC
-        """)
-        preview_data = cursor.fetchall()
-
-        # Convert date/time fields to string for JSON serialization
-        for row in preview_data:
-            if isinstance(row["shift_date"], (datetime, )):
-                row["shift_date"] = row["shift_date"].date().isoformat()
-            elif hasattr(row["shift_date"], "isoformat"):
-                row["shift_date"] = row["shift_date"].isoformat()
-            if "time_in" in row and hasattr(row["time_in"], "isoformat"):
-                row["time_in"] = row["time_in"].isoformat()
-            if "time_out" in row and hasattr(row["time_out"], "isoformat"):
-                row["time_out"] = row["time_out"].isoformat()
+                            if delta:
+                                rows = [row + (modified.get(row[1]),) for row in rows]
+                                changes = upsert_staged_shifts(cursor, rows)
+                                for key, count in changes.items():
+                                    counts["imported" if key == "inserted" else key] += count
+                                # Shifts already staged with the same times
+                                counts["skipped"] += len(set(row[1] for row in rows)) - sum(changes.values())
+                                page_modified = [m for m in modified.values() if m]
+                                if page_modified:
+                                    last_modified_ms = max([last_modified_ms or 0] + page_modified)
+                            else:
+                                # One multi-row INSERT per Clover page, i.e. a single round trip
+                                # for almost every employee; RETURNING tells us what was new
+                                inserted = insert_staged_shifts(cursor, rows)
+                                counts["imported"] += len(inserted)
+                                counts["skipped"] += len(rows) - len(inserted)
+                            job.update_employee(employee_id, **counts)
+                        # Watermarks move in the same transaction as the staged rows
+                        sync_state.advance(cursor, emp["clover_employee_id"], employee_id, tracker.watermark(),
+                                           last_modified_ms, mode=mode)
+                        conn.commit()
+                        job.finish_employee(employee_id, **counts)
+                        log_event("bulk_sync.employee", job_id=job.id, employee_id=employee_id, start_ms=start_ms,
+                                  modified_since=modified_since, **counts,
+                                  duration_ms=round((time.perf_counter() - employee_started) * 1000, 1))
+                    except CloverAPIError as api_err:
+                        log_event("bulk_sync.employee", level="error", job_id=job.id, employee_id=employee_id,
+                                  status=api_err.status_code, error=api_err.text[:500])
+                        conn.rollback()
+                        job.finish_employee(employee_id, error=api_err.text)
+                        continue
+                    except Exception as e:
+                        log_event("bulk_sync.employee", level="error", job_id=job.id, employee_id=employee_id, error=str(e))
+                        # The worker may still be fetching this employee's pages; release it
+                        cancel_pages()
+                        conn.rollback()
+                        job.finish_employee(employee_id, error=str(e))
+                        continue
+            finally:
+                # Unblock any worker still waiting to hand over a page
+                stop.set()
+        summary.update(job.totals)
 
-        # Sort preview_data by shift_date in ascending order
-        preview_data = sorted(
-            preview_data,
-            key=lambda x: datetime.strptime(x["shift_date"], "%Y-%m-%d").date()
-        )
 
+@app.route('/api/fetch-clover-shifts-bulk', methods=['POST'])
+def fetch_clover_shifts_bulk():
+    try:
+        data = request.get_json(silent=True) or {}
+        force = bool(data.get("force"))
+        # "window": shifts clocked in since each employee's watermark (default).
+        # "delta": shifts Clover modified since the last delta sync, old ones included.
+        mode = data.get("mode", "window")
+        if mode not in ("window", "delta"):
+            return jsonify({"error": "mode must be 'window' or 'delta'"}), 400
+        # Every employee's window ends with today, so a second submission on the same
+        # day while a sync is queued or running just gets that sync back
+        sync_date = datetime.today().date().isoformat()
+        job, created = sync_jobs.submit(f"bulk:{mode}:{sync_date}", run_bulk_sync,
+                                        {"force": force, "mode": mode, "sync_date": sync_date})
         return jsonify({
-            "status": "success",
-            "imported": imported,
-            "skipped": skipped,
-            "errors": errors,
-            "preview": preview_data
-        })
-
+            "status": job.status,
+            "job_id": job.id,
+            "coalesced": not created,
+            "status_url": f"/api/sync-jobs/{job.id}",
+        }), 202
     except Exception as e:
-        print("ERROR IN /api/fetch-clover-shifts-bulk:", e)
+        log_event("route.error", level="error", route="/api/fetch-clover-shifts-bulk", error=str(e))
         return jsonify({"error": "Internal Server Error"}), 500
 
-    finally:
+@app.route("/api/sync-jobs/<job_id>", methods=["GET"])
+def get_sync_job(job_id):
+    job = sync_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown sync job"}), 404
+    return jsonify(job.to_dict())
+
+# --- Clover webhooks ---
+# Clock-in/out events stage just the employees they name, close to real time,
+# instead of waiting for the next bulk sync to poll everyone.
+CLOVER_WEBHOOK_AUTH = os.getenv("CLOVER_WEBHOOK_AUTH")  # X-Clover-Auth code from the Clover app settings
+# Shifts modified this long before an event's ts are fetched too, to absorb clock skew
+CLOVER_WEBHOOK_LOOKBACK_MS = int(os.getenv("CLOVER_WEBHOOK_LOOKBACK_MS", "300000"))
+
+CLOVER_EMPLOYEES_QUERY = """
+    SELECT cem.clover_employee_id, e.id AS employee_id, e.role
+    FROM tbc.clover_employee_map cem
+    JOIN tbc.employees e ON cem.employee_id = e.id
+    WHERE cem.clover_employee_id = ANY(%(clover_employee_ids)s)
+"""
+
+# When Clover ignores the modifiedTime filter, a webhook stages the shifts clocked in
+# from this long before its event instead (a clock-out closes a shift opened hours
+# earlier); edits to older shifts then wait for the next window sync
+CLOVER_WEBHOOK_WINDOW_MS = int(os.getenv("CLOVER_WEBHOOK_WINDOW_MS", str(24 * 3600 * 1000)))
+
+def webhook_shift_pages(clover_emp_id, since_ms):
+    if clover_client.modified_filter_supported is not False:
         try:
-            cursor.close()
-            conn.close()
-        except:
-            pass
+            yield from clover_client.iter_modified_shift_pages(clover_emp_id, since_ms, prefetch=False)
+            return
+        except UnsupportedFilterError:
+            log_event("clover_webhook.delta_unsupported", level="warning", clover_employee_id=clover_emp_id)
+    end_ms = int(time.time() * 1000) + 1
+    yield from clover_client.iter_shift_pages(clover_emp_id, since_ms - CLOVER_WEBHOOK_WINDOW_MS, end_ms, prefetch=False)
+
+def stage_webhook_changes(changes):
+    """Fetch and upsert the shifts Clover modified for each employee in `changes`.
+
+    `changes` maps clover_employee_id -> earliest event ts (epoch ms). Every
+    employee's shifts go into one upsert, deduplicated by clover_shift_id. No
+    DB connection is held while Clover answers.
+    """
+    with timed("clover_webhook.flush", employees=len(changes)) as summary:
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            migrations.ensure_schema(conn)
+            cursor.execute(CLOVER_EMPLOYEES_QUERY, {"clover_employee_ids": list(changes)})
+            employees = cursor.fetchall()
+        summary["unmapped"] = len(changes) - len(employees)
+        rows = []
+        for emp in employees:
+            since_ms = changes[emp["clover_employee_id"]] - CLOVER_WEBHOOK_LOOKBACK_MS
+            try:
+                for clover_shifts in webhook_shift_pages(emp["clover_employee_id"], since_ms):
+                    modified = {shift.get("id"): shift.get(SHIFT_MODIFIED_FIELD) for shift in clover_shifts}
+                    normalized, _ = normalize_clover_shifts(clover_shifts)
+                    rows.extend(
+                        (
+                            emp["employee_id"],
+                            shift["clover_shift_id"],
+                            shift["shift_date"],
+                            shift["time_in"],
+                            shift["time_out"],
+                            emp["role"],
+                            shift["shift_label"],
+                            shift["decimal_hours"],
+                            modified.get(shift["clover_shift_id"]),
+                        )
+                        for shift in normalized
+                    )
+            except CloverAPIError as api_err:
+                # The rest of the batch still goes in; the next delta sync covers this one
+                log_event("clover_webhook.clover_error", level="error", clover_employee_id=emp["clover_employee_id"],
+                          status=api_err.status_code, error=api_err.text[:500])
+        with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            counts = upsert_staged_shifts(cursor, rows)
+            conn.commit()
+        summary.update(counts, fetched=len(rows))
+
+webhook_batcher = WebhookBatcher(stage_webhook_changes,
+                                 flush_interval=float(os.getenv("CLOVER_WEBHOOK_FLUSH_SECONDS", "2")))
+
+@app.route("/api/clover/webhook", methods=["POST"])
+def clover_webhook_receive():
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({"error": "Expected a JSON object"}), 400
+    if "verificationCode" in payload:
+        # One-off handshake when the webhook URL is saved in the Clover dashboard
+        log_event("clover_webhook.verification", verification_code=payload["verificationCode"])
+        return jsonify({"status": "ok"})
+    if not clover_webhook.verify(request.headers.get(clover_webhook.AUTH_HEADER), CLOVER_WEBHOOK_AUTH):
+        return jsonify({"error": "Invalid webhook signature"}), 401
+    events, ignored = clover_webhook.parse_events(payload, CLOVER_MERCHANT_ID)
+    clover_webhook.WEBHOOK_EVENTS.inc(ignored, outcome="ignored")
+    queued = webhook_batcher.submit(events)
+    return jsonify({"status": "ok", "queued": queued, "ignored": ignored})
+
+@app.route("/api/staged-shifts", methods=["GET"])
+def get_staged_shifts():
+    # Unpromoted staged shifts for review, one keyset page at a time (?limit=, ?cursor=).
+    # Pass ?since=<next_since from a finished walk> to get only rows staged or
+    # changed by a sync after it; rows near the boundary may repeat.
+    # ?review=true lists promoted shifts Clover changed afterwards (needs_review)
+    # instead; submitting one again replaces its promoted shift.
+    try:
+        review = request.args.get("review", "").lower() in ("1", "true", "yes")
+        cursor_token = request.args.get("cursor")
+        after, as_of = staged_queries.decode_cursor(cursor_token) if cursor_token else (None, None)
+        since_token = request.args.get("since")
+        since = staged_queries.decode_since(since_token) if since_token else None
+        limit = shift_queries.parse_limit(request.args.get("limit"))
+    except shift_queries.QueryParamError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        with get_db_connection() as conn:
+            migrations.ensure_schema(conn)
+            with serialization.iso_cursor(conn) as cursor:
+                if as_of is None:
+                    # A new walk: rows staged after this point belong to the next ?since
+                    cursor.execute("SELECT now()")
+                    as_of = datetime.fromisoformat(cursor.fetchone()[0])
+                # Fetch one extra row to know whether another page exists
+                sql, params = staged_queries.build_query(since=since, after=after, limit=limit + 1, review=review)
+                cursor.execute(sql, params)
+                rows = cursor.fetchall()
+
+        columns = staged_queries.STAGED_COLUMNS
+        shifts = [staged_queries.staged_record(columns, row) for row in rows[:limit]]
+        next_cursor = staged_queries.encode_cursor(shifts[-1], as_of) if len(rows) > limit else None
+        return jsonify({
+            "shifts": shifts,
+            "next_cursor": next_cursor,
+            "next_since": staged_queries.encode_since(as_of),
+        })
+    except Exception as e:
+        log_event("route.error", level="error", route="/api/staged-shifts", error=str(e))
+        return jsonify({"error": "Internal Server Error"}), 500
 
 @app.route("/api/submit-clover-shifts", methods=["POST"])
 def submit_clover_shifts():
     try:
-        print("=== Submitting Clover Shifts ===")
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        with get_db_connection() as conn, conn.cursor() as cursor:
+            migrations.ensure_schema(conn)
+            data = request.json
+            shifts = data.get("shifts")
 
-        data = request.json
-        shifts = data.get("shifts")
+            if not shifts:
+                return jsonify({"error": "No shift data provided"}), 400
 
-        if not shifts:
-            return jsonify({"error": "No shift data provided"}), 400
+            rows, errors = promotion.parse_submitted(shifts)
+            if errors:
+                return jsonify({"error": "Invalid shifts", "details": errors}), 400
 
-        insert_query = """
-            INSERT INTO tbc.shifts_dummy_20250719 (
-                employee_id, shift_date, time_in, time_out, work_area,
-                shift_label, decimal_hours, notes
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            ON CONFLICT DO NOTHING
-        """
-
-        promoted_ids = []
-        for shift in shifts:
-            cursor.execute(insert_query, (
-                shift["employee_id"],
-                shift["shift_date"],
-                shift["time_in"],
-                shift["time_out"],
-                shift["work_area"],
-                shift["shift_label"],
-                shift["decimal_hours"],
-                shift["notes"]
-            ))
-            # Collect staged shift id for promotion if present
-            if "id" in shift:
-                promoted_ids.append(shift["id"])
-
-        # Mark corresponding staged_shifts as promoted
-        if promoted_ids:
-            cursor.execute(
-                f"UPDATE tbc.staged_shifts SET is_promoted = TRUE WHERE id = ANY(%s)",
-                (promoted_ids,)
-            )
+            # Overlaps and over-long shifts need an explicit "allow_anomalies": true
+            anomalies = shift_checks.check(cursor, rows)
+            if shift_checks.blocking(anomalies) and not data.get("allow_anomalies"):
+                conn.rollback()
+                return jsonify({"error": "Shifts need review", "anomalies": anomalies}), 409
+
+            # One statement inserts the batch (or revises the shifts that flagged rows
+            # replace), marks the staged rows promoted and reports what happened to
+            # each posted row
+            results = promotion.promote(cursor, rows)
+            inserted = [r for r in results if r["outcome"] == "inserted"]
+            revised = [r for r in results if r["outcome"] == "revised"]
+
+            # Re-sum only the employee-weeks that gained, lost or changed shifts
+            touched = [(r["employee_id"], r["shift_date"]) for r in inserted + revised]
+            touched += [(r["previous_employee_id"], r["previous_date"]) for r in revised]
+            hours_summary.refresh(cursor, touched)
 
-        conn.commit()
-        return jsonify({"status": "success", "message": f"Inserted {len(shifts)} shifts and promoted {len(promoted_ids)} staged shifts."})
+            conn.commit()
+            invalidate_coverage_cache({shift_date for _, shift_date in touched})
+
+            counts = {}
+            for r in results:
+                counts[r["outcome"]] = counts.get(r["outcome"], 0) + 1
+            promoted = sum(1 for r in results if r["promoted"])
+            for r in results:
+                r["shift_date"] = r["shift_date"].isoformat() if r["shift_date"] else None
+                r["previous_date"] = r["previous_date"].isoformat() if r["previous_date"] else None
+            return jsonify({
+                "status": "success",
+                "message": f"Inserted {len(inserted)} of {len(results)} shifts and promoted {promoted} staged shifts.",
+                "inserted": len(inserted),
+                "revised": len(revised),
+                "promoted": promoted,
+                "outcomes": counts,
+                "results": results,
+                "anomalies": anomalies,
+            })
 
     except Exception as e:
-        print("ERROR IN /api/submit_clover_shifts:", e)
+        log_event("route.error", level="error", route="/api/submit-clover-shifts", error=str(e))
         return jsonify({"error": "Failed to insert shifts"}), 500
 
-    finally:
-        try:
-            cursor.close()
-            conn.close()
-        except:
-            pass
+@app.route("/api/submit-clover-shifts/dry-run", methods=["POST"])
+def check_clover_shifts():
+    # Same body as /api/submit-clover-shifts; reports anomalies without writing anything
+    try:
+        data = request.get_json(silent=True) or {}
+        shifts = data.get("shifts")
+        if not shifts:
+            return jsonify({"error": "No shift data provided"}), 400
+        rows, errors = promotion.parse_submitted(shifts)
+        if errors:
+            return jsonify({"error": "Invalid shifts", "details": errors}), 400
+        with get_db_connection() as conn, conn.cursor() as cursor:
+            migrations.ensure_schema(conn)
+            anomalies = shift_checks.check(cursor, rows)
+            conn.rollback()
+        return jsonify({
+            "anomalies": anomalies,
+            "blocking": len(shift_checks.blocking(anomalies)),
+        })
+    except Exception as e:
+        log_event("route.error", level="error", route="/api/submit-clover-shifts/dry-run", error=str(e))
+        return jsonify({"error": "Internal Server Error"}), 500
 
 # --- Employees API ---
-@app.route("/api/employees", methods=["GET"])
-def get_employees():
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+# The list rarely changes, so each worker caches the serialized payload and its ETag.
+# Anything that writes tbc.employees or tbc.clover_employee_map must call
+# invalidate_employee_cache(); the TTL covers edits made outside this app.
+EMPLOYEES_CACHE_TTL = float(os.getenv("EMPLOYEES_CACHE_TTL", "300"))
+employees_cache = TTLCache(ttl=EMPLOYEES_CACHE_TTL)
+
+def invalidate_employee_cache():
+    employees_cache.invalidate()
 
+def load_employees_payload():
+    with get_db_connection() as conn, conn.cursor() as cursor:
         cursor.execute("""
             SELECT
                 id,
@@ -463,65 +823,234 @@ def get_employees():
                 is_active,
                 position,
                 address
-            FROM tbc.employees;
+            FROM tbc.employees
+            ORDER BY id;
         """)  # << If your table is inside 'tbc' schema
 
         rows = cursor.fetchall()
         columns = [desc[0] for desc in cursor.description]
         employees = [dict(zip(columns, row)) for row in rows]
 
-        cursor.close()
-        conn.close()
+    body = app.json.dumps(employees)
+    # ETag is a digest of the payload itself, so it only changes when the data does
+    etag = hashlib.sha1(body.encode("utf-8")).hexdigest()
+    return body, etag
 
-        return jsonify(employees)
+@app.route("/api/employees", methods=["GET"])
+def get_employees():
+    try:
+        body, etag = employees_cache.get_or_load("employees", load_employees_payload)
+        response = Response(body, mimetype="application/json")
+        response.set_etag(etag)
+        # Let browsers keep the body but revalidate with If-None-Match every time
+        response.headers["Cache-Control"] = "no-cache"
+        # Answers 304 Not Modified when If-None-Match matches
+        return response.make_conditional(request)
 
     except Exception as e:
-        print("ERROR IN /api/employees:", e)
+        log_event("route.error", level="error", route="/api/employees", error=str(e))
         return jsonify({"error": "Internal Server Error"}), 500
 
+@app.route("/api/employees/cache/invalidate", methods=["POST"])
+def post_invalidate_employee_cache():
+    # For edits made directly in Supabase (e.g. a new Clover mapping)
+    invalidate_employee_cache()
+    return jsonify({"status": "success"})
+
 
 @app.route("/api/shifts", methods=["GET"])
 def get_shifts():
+    # Optional filters: from, to (YYYY-MM-DD), employee_id, work_area, shift_label.
+    # ?limit=N and/or ?cursor=... return one keyset page plus next_cursor;
+    # ?stream=true streams the whole (filtered) list from a server-side cursor.
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        where, params = shift_queries.parse_filters(request.args)
+        cursor_token = request.args.get("cursor")
+        after = shift_queries.decode_cursor(cursor_token) if cursor_token else None
+        paged = after is not None or "limit" in request.args
+        limit = shift_queries.parse_limit(request.args.get("limit")) if paged else None
+        stream = request.args.get("stream", "").lower() in ("1", "true", "yes")
+    except shift_queries.QueryParamError as e:
+        return jsonify({"error": str(e)}), 400
 
-        cursor.execute("""
-        SELECT 
-            s.id,
-            s.shift_date,
-            s.employee_id,
-            e.preferred_name,
-            s.time_in,
-            s.time_out,
-            s.work_area,
-            s.shift_label,
-            s.decimal_hours,
-            s.notes
-        FROM tbc.shifts_dummy_20250719 s
-        JOIN tbc.employees e ON s.employee_id = e.id
-        ORDER BY s.shift_date DESC, s.time_in ASC;
-    """)
+    if stream and not paged:
+        sql, params = shift_queries.build_query(where, params)
+        body = stream_shifts(sql, params)
+        try:
+            # Runs the query before answering, so a failed query is still a 500
+            first_chunk = next(body)
+        except Exception as e:
+            log_event("route.error", level="error", route="/api/shifts", error=str(e))
+            return jsonify({"error": "Internal Server Error"}), 500
+        return Response(stream_with_context(itertools.chain([first_chunk], body)), mimetype="application/json")
 
-        rows = cursor.fetchall()
-        columns = [desc[0] for desc in cursor.description]
-        shifts = []
+    try:
+        with get_db_connection() as conn, serialization.iso_cursor(conn) as cursor:
+            # Fetch one extra row to know whether another page exists
+            sql, params = shift_queries.build_query(where, params, after=after, limit=limit + 1 if paged else None)
+            cursor.execute(sql, params)
+
+            rows = cursor.fetchall()
+            columns = [desc[0] for desc in cursor.description]
+            shifts = [shift_queries.shift_record(columns, row) for row in rows[:limit]]
+
+            if not paged:
+                return jsonify(shifts)
+            next_cursor = shift_queries.encode_cursor(shifts[-1]) if len(rows) > limit else None
+            return jsonify({"shifts": shifts, "next_cursor": next_cursor})
+
+    except Exception as e:
+        log_event("route.error", level="error", route="/api/shifts", error=str(e))
+        return jsonify({"error": "Internal Server Error"}), 500
+
+
+SHIFTS_STREAM_BATCH = 500
+
+def stream_shifts(sql, params):
+    # Emits a JSON array row by row from a named (server-side) cursor, so neither
+    # the worker nor psycopg2 ever holds the full result set. The first chunk is
+    # only yielded once the query has run.
+    columns = shift_queries.SHIFT_COLUMNS
+    rows = db.iter_query(sql, params, name="shifts_stream", itersize=SHIFTS_STREAM_BATCH,
+                         types=serialization.ISO_TYPES)
+    first = next(rows, None)
+    yield "[" + ("" if first is None else app.json.dumps(shift_queries.shift_record(columns, first)))
+    try:
         for row in rows:
-            record = dict(zip(columns, row))
-            # Convert time/date fields to string
-            record["shift_date"] = record["shift_date"].isoformat() # this ensures shift_date → "2023-07-07"
-            record["time_in"] = record["time_in"].isoformat() # this ensures time_in → "17:00:00"
-            record["time_out"] = record["time_out"].isoformat() # this ensures time_out → "20:30:00"
-            shifts.append(record)
+            yield "," + app.json.dumps(shift_queries.shift_record(columns, row))
+    except Exception as e:
+        # Headers are already sent: abort the body without its closing bracket, so
+        # the client sees a broken response rather than a short but valid list
+        log_event("route.error", level="error", route="/api/shifts", stage="stream", error=str(e))
+        raise
+    yield "]"
+
+
+# --- Pay-period hours ---
+@app.route("/api/hours-summary", methods=["GET"])
+def get_hours_summary():
+    # ?period=weekly|biweekly&from=&to=&employee_id=; from/to widen to whole periods
+    try:
+        sql, params = hours_summary.build_query(request.args)
+    except shift_queries.QueryParamError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        with get_db_connection() as conn:
+            migrations.ensure_schema(conn)
+            with serialization.iso_cursor(conn, cursor_factory=RealDictCursor) as cursor:
+                cursor.execute(sql, params)
+                rows = cursor.fetchall()
+        for row in rows:
+            row["total_hours"] = float(row["total_hours"])
+        return jsonify({"period": request.args.get("period", "weekly"), "rows": rows})
+    except Exception as e:
+        log_event("route.error", level="error", route="/api/hours-summary", error=str(e))
+        return jsonify({"error": "Internal Server Error"}), 500
+
+@app.route("/api/hours-summary/rebuild", methods=["POST"])
+def rebuild_hours_summary():
+    # For repairs after shifts are edited directly in Supabase
+    try:
+        with get_db_connection() as conn:
+            migrations.ensure_schema(conn)
+            with conn.cursor() as cursor:
+                count = hours_summary.rebuild(cursor)
+            conn.commit()
+        return jsonify({"status": "rebuilt", "rows": count})
+    except Exception as e:
+        log_event("route.error", level="error", route="/api/hours-summary/rebuild", error=str(e))
+        return jsonify({"error": "Internal Server Error"}), 500
+
+
+# --- Staffing coverage ---
+# Heatmap grids are costly to build from years of shifts and only change when
+# shifts are promoted, so each worker caches them per (range, filters). Writes
+# must call invalidate_coverage_cache() with the dates they touched; the TTL
+# covers edits made outside this app (e.g. the history loader).
+COVERAGE_CACHE_TTL = float(os.getenv("COVERAGE_CACHE_TTL", "600"))
+coverage_cache = TTLCache(ttl=COVERAGE_CACHE_TTL, maxsize=64)
 
-        cursor.close()
-        conn.close()
+def invalidate_coverage_cache(shift_dates):
+    if shift_dates:
+        coverage_cache.invalidate_where(lambda key: coverage.covers(key, shift_dates))
 
-        return jsonify(shifts)
+def load_coverage(params):
+    sql, params = coverage.build_query(params)
+    with get_db_connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+    result = coverage.compute(row, params["slot_minutes"])
+    return {
+        "from": params["from"].isoformat(),
+        "to": params["to"].isoformat(),
+        "work_area": params["work_area"],
+        "employee_id": params["employee_id"],
+        "slot_minutes": params["slot_minutes"],
+        "weekday_days": coverage.weekday_counts(params["from"], params["to"]),
+        **result,
+    }
 
+@app.route("/api/analytics/coverage", methods=["GET"])
+def get_coverage():
+    # ?from=&to= (default: the last 365 days), optional work_area, employee_id and
+    # slot_minutes (15/30/60). Grids are 7 weekdays (Monday first) x slots of
+    # staff-hours summed over the range; divide by weekday_days for an average day.
+    try:
+        params = coverage.parse_args(request.args)
+    except shift_queries.QueryParamError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        result = coverage_cache.get_or_load(coverage.cache_key(params), lambda: load_coverage(params))
+        return jsonify(result)
+    except Exception as e:
+        log_event("route.error", level="error", route="/api/analytics/coverage", error=str(e))
+        return jsonify({"error": "Internal Server Error"}), 500
+
+
+# --- Payroll export ---
+@app.route("/api/shifts/export", methods=["GET"])
+def export_shifts():
+    # ?format=csv|xlsx plus the /api/shifts filters (from, to, employee_id, ...);
+    # ?subtotals=true adds an hours subtotal row after each employee
+    export_format = request.args.get("format", "csv").lower()
+    if export_format not in ("csv", "xlsx"):
+        return jsonify({"error": "format must be 'csv' or 'xlsx'"}), 400
+    try:
+        where, params = shift_queries.parse_filters(request.args)
+    except shift_queries.QueryParamError as e:
+        return jsonify({"error": str(e)}), 400
+    subtotals = request.args.get("subtotals", "").lower() in ("1", "true", "yes")
+    sql, params = shift_export.build_export_query(where, params)
+
+    def export_rows():
+        rows = db.iter_query(sql, params, name="shifts_export", itersize=SHIFTS_STREAM_BATCH)
+        return shift_export.with_subtotals(rows) if subtotals else rows
+
+    filename = f"shifts_{request.args.get('from') or 'start'}_{request.args.get('to') or 'latest'}.{export_format}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+
+    if export_format == "csv":
+        # Chunked response straight off the server-side cursor
+        body = shift_export.iter_csv(export_rows())
+        try:
+            # Runs the query before answering, so a failed query is still a 500
+            first_chunk = next(body)
+        except Exception as e:
+            log_event("route.error", level="error", route="/api/shifts/export", error=str(e))
+            return jsonify({"error": "Internal Server Error"}), 500
+        return Response(stream_with_context(itertools.chain([first_chunk], body)),
+                        mimetype="text/csv", headers=headers)
+
+    try:
+        # The xlsx zip can only be finalised once every row is in, so it is built in a
+        # disk-backed temp file first and then streamed out in chunks
+        xlsx = shift_export.write_xlsx(export_rows())
     except Exception as e:
-        print("ERROR IN /api/shifts:", e)
+        log_event("route.error", level="error", route="/api/shifts/export", error=str(e))
         return jsonify({"error": "Internal Server Error"}), 500
+    return Response(shift_export.iter_file(xlsx),
+                    mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                    headers=headers)
 
 
 # --- Main Entry ---
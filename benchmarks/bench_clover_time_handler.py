@@ -0,0 +1,60 @@
+"""Micro-benchmark: scalar vs batch/cached conversions in utils.clover_time_handler.
+
+Run from the repo root:
+    python -m benchmarks.bench_clover_time_handler
+"""
+import random
+import timeit
+import zoneinfo
+from datetime import date, datetime, timedelta
+
+from utils import clover_time_handler
+
+
+# The pre-cache scalar implementations, kept here as the baseline
+def baseline_epoch_to_readable(epoch_ms):
+    utc_dt = datetime.fromtimestamp(epoch_ms / 1000, tz=zoneinfo.ZoneInfo('UTC'))
+    pst_dt = utc_dt.astimezone(zoneinfo.ZoneInfo('America/Los_Angeles'))
+    return {'utc': utc_dt.isoformat(), 'pst': pst_dt.isoformat()}
+
+
+def baseline_readable_to_epoch(date_str, position, tz_str='America/Los_Angeles'):
+    tz = zoneinfo.ZoneInfo(tz_str)
+    dt = datetime.strptime(date_str, "%Y-%m-%d").replace(tzinfo=tz)
+    if position == 'start':
+        dt = dt.replace(hour=0, minute=0, second=0, microsecond=0)
+    else:
+        dt = dt.replace(hour=23, minute=59, second=0, microsecond=0)
+    return int(dt.timestamp() * 1000)
+
+
+def main(employees=40, days=14, epochs=5000, repeat=5):
+    random.seed(7)
+    today = date(2025, 7, 19)
+    # A bulk sync: every employee's window starts on one of a handful of days
+    starts = [(today - timedelta(days=random.randint(1, days))).isoformat() for _ in range(employees)]
+    ends = [today.isoformat()] * employees
+    epoch_list = [random.randint(1690000000000, 1760000000000) for _ in range(epochs)]
+
+    assert clover_time_handler.readable_to_epoch_many(starts, "start") == [baseline_readable_to_epoch(d, "start") for d in starts]
+    assert clover_time_handler.epoch_to_readable_many(epoch_list[:100]) == [baseline_epoch_to_readable(e) for e in epoch_list[:100]]
+
+    cases = {
+        "readable_to_epoch  scalar (baseline)": lambda: (
+            [baseline_readable_to_epoch(d, "start") for d in starts],
+            [baseline_readable_to_epoch(d, "end") for d in ends],
+        ),
+        "readable_to_epoch_many (cached)": lambda: (
+            clover_time_handler.readable_to_epoch_many(starts, "start"),
+            clover_time_handler.readable_to_epoch_many(ends, "end"),
+        ),
+        "epoch_to_readable  scalar (baseline)": lambda: [baseline_epoch_to_readable(e) for e in epoch_list],
+        "epoch_to_readable_many": lambda: clover_time_handler.epoch_to_readable_many(epoch_list),
+    }
+    for name, fn in cases.items():
+        best = min(timeit.repeat(fn, number=10, repeat=repeat)) / 10
+        print(f"{name:<40} {best * 1000:9.3f} ms/run")
+
+
+if __name__ == "__main__":
+    main()
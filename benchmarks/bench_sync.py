@@ -0,0 +1,187 @@
+"""End-to-end benchmark of the Clover sync endpoints against a local stand-in.
+
+Runs the real app (through Flask's test client) against benchmarks.fake_clover
+and a local Postgres, and reports wall time, shifts/sec, p50/p99 request
+latency, Clover requests/429s and DB round trips for:
+
+  bulk-cold     POST /api/fetch-clover-shifts-bulk with nothing staged yet
+                (the run fails unless every seeded shift ends up staged)
+  bulk-steady   the same again straight after (everything already staged)
+  bulk-delta    mode=delta after a few percent of shifts were edited in "Clover"
+  single        POST /api/fetch-clover-shifts once per employee
+
+Needs a throwaway database; --setup DROPS and recreates the tbc schema in it:
+    createdb tbc_bench
+    BENCH_DATABASE_URL=postgresql://localhost/tbc_bench python -m benchmarks.bench_sync --setup
+    BENCH_DATABASE_URL=... python -m benchmarks.bench_sync --employees 40 --shifts 365 --latency-ms 80 --throttle-every 50
+"""
+import argparse
+import math
+import os
+import sys
+import time
+
+import psycopg2
+
+from benchmarks.fake_clover import DAY_MS, FakeClover
+from utils import metrics
+from utils import migrations
+
+def round_trips():
+    # Statements and commits so far, from the instrumented pool connections (utils.db)
+    commits = metrics.DB_QUERY_SECONDS.count(statement="COMMIT")
+    rollbacks = metrics.DB_QUERY_SECONDS.count(statement="ROLLBACK")
+    return {"statements": metrics.DB_QUERY_SECONDS.count() - commits - rollbacks, "commits": commits}
+
+
+def percentile(values, p):
+    # Nearest-rank percentile; fine for the handful of samples a run produces
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def setup_schema(dsn, employees):
+    with psycopg2.connect(dsn) as conn, conn.cursor() as cursor:
+        # Same tables and indexes as the app, from utils/migrations.py
+        cursor.execute("DROP SCHEMA IF EXISTS tbc CASCADE")
+        migrations.migrate(conn)
+        for n in range(1, employees + 1):
+            cursor.execute(
+                "INSERT INTO tbc.employees (first_name, preferred_name, role) VALUES (%s, %s, %s) RETURNING id",
+                (f"Bench{n}", f"B{n}", "Front" if n % 2 else "Back"))
+            cursor.execute("INSERT INTO tbc.clover_employee_map (employee_id, clover_employee_id) VALUES (%s, %s)",
+                           (cursor.fetchone()[0], f"E{n}"))
+    print(f"Created tbc schema with {employees} Clover-mapped employees")
+
+
+def reset_staging(app, shifts):
+    # Empty staging and point every watermark at the start of the generated history,
+    # so a cold bulk sync imports all of it
+    start_ms = int(time.time() * 1000) - (shifts + 2) * DAY_MS
+    with app.db.connection() as conn:
+        app.migrations.ensure_schema(conn)
+        with conn.cursor() as cursor:
+            cursor.execute("TRUNCATE tbc.staged_shifts, tbc.sync_state")
+            cursor.execute("""
+                INSERT INTO tbc.sync_state (clover_employee_id, employee_id, last_synced_ms, synced_at)
+                SELECT clover_employee_id, employee_id, %s, now() - interval '1 day'
+                FROM tbc.clover_employee_map
+            """, (start_ms,))
+        conn.commit()
+
+
+def check_staged(app, fake):
+    # Every complete seeded shift of a mapped employee must be staged; a sync that
+    # stopped paging early would otherwise just look faster
+    with app.db.connection() as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT clover_employee_id FROM tbc.clover_employee_map")
+        mapped = [row[0] for row in cursor.fetchall()]
+        cursor.execute("SELECT count(*) FROM tbc.staged_shifts")
+        staged = cursor.fetchone()[0]
+    seeded = sum(1 for clover_emp_id in mapped for shift in fake.shifts.get(clover_emp_id, [])
+                 if shift.get("outTime"))
+    if staged != seeded:
+        raise RuntimeError(f"staged {staged} shifts but Clover holds {seeded}; the import is incomplete")
+
+
+def measure(name, fake, fn):
+    """Run fn() -> (shifts_staged, latencies_s) and print one result line."""
+    fake.reset_stats()
+    before = round_trips()
+    started = time.perf_counter()
+    staged, latencies = fn()
+    elapsed = time.perf_counter() - started
+    served = fake.stats()
+    trips = {key: value - before[key] for key, value in round_trips().items()}
+    p50, p99 = percentile(latencies, 50), percentile(latencies, 99)
+    print(f"{name:<12} {elapsed:8.2f}s  {served['shifts_served'] / elapsed:9.0f} shifts/s  "
+          f"staged {staged:6d}  p50 {p50 * 1000:8.1f}ms  p99 {p99 * 1000:8.1f}ms  "
+          f"clover {served['requests']:5d} req ({served['throttled']} x 429)  "
+          f"db {trips['statements']:6d} stmts {trips['commits']:5d} commits")
+
+
+def run_bulk(client, body):
+    started = time.perf_counter()
+    response = client.post("/api/fetch-clover-shifts-bulk", json=body)
+    if response.status_code != 202:
+        raise RuntimeError(f"bulk sync returned {response.status_code}: {response.get_data(as_text=True)}")
+    status_url = response.get_json()["status_url"]
+    while True:
+        job = client.get(status_url).get_json()
+        if job["status"] not in ("queued", "running"):
+            break
+        time.sleep(0.02)
+    if job["status"] != "succeeded" or job["errors"]:
+        raise RuntimeError(f"bulk sync job {job['status']}: {job['error'] or job['errors'][:3]}")
+    return job["imported"] + job["updated"], [time.perf_counter() - started]
+
+
+def run_single(client, employee_ids):
+    latencies = []
+    staged = 0
+    for employee_id in employee_ids:
+        started = time.perf_counter()
+        response = client.post("/api/fetch-clover-shifts", json={"employee_id": employee_id})
+        latencies.append(time.perf_counter() - started)
+        if response.status_code != 200:
+            raise RuntimeError(f"single fetch returned {response.status_code}: {response.get_data(as_text=True)}")
+        staged += len(response.get_json()["preview"])
+    return staged, latencies
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end Clover sync benchmark")
+    parser.add_argument("--setup", action="store_true", help="drop and recreate the tbc schema first")
+    parser.add_argument("--employees", type=int, default=20)
+    parser.add_argument("--shifts", type=int, default=90, help="shifts per employee")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="fake Clover response latency")
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--max-page-size", type=int, default=1000, help="cap on Clover page size (forces paging)")
+    parser.add_argument("--throttle-every", type=int, default=0, help="answer every Nth Clover request with 429")
+    parser.add_argument("--edit-fraction", type=float, default=0.02, help="share of shifts edited before bulk-delta")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    dsn = os.getenv("BENCH_DATABASE_URL")
+    if not dsn:
+        sys.exit("Set BENCH_DATABASE_URL to a throwaway local database (never the Supabase one)")
+    if args.setup:
+        setup_schema(dsn, args.employees)
+
+    fake = FakeClover(args.employees, args.shifts, args.latency_ms, args.jitter_ms,
+                      args.max_page_size, args.throttle_every).serve()
+
+    # app reads its configuration at import time
+    os.environ.update({
+        "DATABASE_URL": dsn,
+        "MERCHANT_ID": "BENCHMERCHANT",
+        "AUTHORIZATION_TOKEN": "bench",
+        "CLOVER_BASE_URL": fake.base_url,
+        "CLOVER_SYNC_MIN_INTERVAL": "0",
+    })
+    import app
+
+    client = app.app.test_client()
+    with app.db.connection() as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT employee_id FROM tbc.clover_employee_map ORDER BY employee_id")
+        employee_ids = [row[0] for row in cursor.fetchall()]
+
+    print(f"{len(employee_ids)} employees x {args.shifts} shifts, Clover latency {args.latency_ms:g}ms, "
+          f"page cap {args.max_page_size}, 429 every {args.throttle_every or '-'} requests")
+    for run in range(1, args.runs + 1):
+        print(f"--- run {run}")
+        reset_staging(app, args.shifts)
+        measure("bulk-cold", fake, lambda: run_bulk(client, {"force": True}))
+        check_staged(app, fake)
+        measure("bulk-steady", fake, lambda: run_bulk(client, {"force": True}))
+        fake.edit_shifts(args.edit_fraction, seed=run)
+        measure("bulk-delta", fake, lambda: run_bulk(client, {"force": True, "mode": "delta"}))
+        measure("single", fake, lambda: run_single(client, employee_ids))
+    print(f"pool: {app.db.pool_stats()}")
+    fake.shutdown()
+
+
+if __name__ == "__main__":
+    main()
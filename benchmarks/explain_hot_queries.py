@@ -0,0 +1,165 @@
+"""Check that the app's hot queries use indexes at realistic table sizes.
+
+Seeds a local Postgres with a few years of shifts, then runs EXPLAIN on each
+hot query, built the same way the app builds it. Exits non-zero if any of them
+plans a sequential scan over one of the large tables. Re-run it after changing
+a query or the indexes in utils/migrations.py.
+
+Needs a throwaway database; --setup DROPS and recreates the tbc schema in it:
+    createdb tbc_bench
+    BENCH_DATABASE_URL=postgresql://localhost/tbc_bench python -m benchmarks.explain_hot_queries --setup
+    BENCH_DATABASE_URL=... python -m benchmarks.explain_hot_queries
+"""
+import argparse
+import os
+import sys
+from datetime import date, datetime, time, timedelta, timezone
+
+import psycopg2
+from psycopg2.extensions import AsIs
+from werkzeug.datastructures import MultiDict
+
+from utils import hours_summary
+from utils import migrations
+from utils import shift_queries
+from utils import staged_queries
+
+# Tables that grow with history; a Seq Scan on tbc.employees is fine
+LARGE_TABLES = {"shifts_dummy_20250719", "staged_shifts", "hours_summary"}
+
+SEED = """
+    INSERT INTO tbc.employees (first_name, preferred_name, role)
+    SELECT 'Seed' || n, 'S' || n, CASE WHEN n %% 2 = 0 THEN 'Back' ELSE 'Front' END
+    FROM generate_series(1, %(employees)s) AS n;
+
+    INSERT INTO tbc.clover_employee_map (employee_id, clover_employee_id)
+    SELECT id, 'E' || id FROM tbc.employees;
+
+    -- Roughly four shifts a week per employee, lunch or dinner
+    INSERT INTO tbc.shifts_dummy_20250719
+        (employee_id, shift_date, time_in, time_out, work_area, shift_label, decimal_hours)
+    SELECT e.id, d::date, t.time_in, t.time_in + interval '3.5 hours', e.role,
+           CASE WHEN t.time_in < time '15:00' THEN 'Lunch' ELSE 'Dinner' END, 3.5
+    FROM tbc.employees e
+    CROSS JOIN generate_series(current_date - %(days)s, current_date - 1, interval '1 day') AS d
+    CROSS JOIN LATERAL (
+        SELECT CASE WHEN (e.id + extract(doy FROM d)::integer) %% 2 = 0
+                    THEN time '11:00' ELSE time '17:00' END AS time_in
+    ) t
+    WHERE random() < 0.6;
+
+    -- Every promoted shift came through staging; the last two weeks await review
+    INSERT INTO tbc.staged_shifts
+        (employee_id, clover_shift_id, shift_date, time_in, time_out, work_area, shift_label,
+         decimal_hours, is_promoted, staged_at)
+    SELECT employee_id, 'C' || id, shift_date, time_in, time_out, work_area, shift_label,
+           decimal_hours, shift_date < current_date - 14, shift_date + time_out
+    FROM tbc.shifts_dummy_20250719;
+"""
+
+
+def seed(dsn, employees, days):
+    with psycopg2.connect(dsn) as conn, conn.cursor() as cursor:
+        cursor.execute("DROP SCHEMA IF EXISTS tbc CASCADE")
+        migrations.migrate(conn)
+        cursor.execute(SEED, {"employees": employees, "days": days})
+        hours_summary.rebuild(cursor)
+        conn.commit()
+        conn.autocommit = True
+        cursor.execute("VACUUM ANALYZE")
+        for table in ("employees", "shifts_dummy_20250719", "staged_shifts", "hours_summary"):
+            cursor.execute(f"SELECT COUNT(*) FROM tbc.{table}")
+            print(f"tbc.{table}: {cursor.fetchone()[0]} rows")
+
+
+def hot_queries(cursor):
+    """(name, sql, params) for each access path the app depends on.
+
+    Writes are the app's own statements with sample rows mogrified in; EXPLAIN
+    without ANALYZE only plans them.
+    """
+    # Imported here: app reads its configuration at import time
+    from app import EMPLOYEE_SYNC_WINDOWS_QUERY, STAGED_SHIFTS_UPSERT, STAGED_SHIFTS_UPSERT_TEMPLATE
+
+    today = date.today()
+    sql, params = shift_queries.build_query([], {}, limit=101)
+    yield "shifts first page", sql, params
+
+    after = {"after_date": today - timedelta(days=30), "after_time": time(11), "after_id": 1}
+    sql, params = shift_queries.build_query([], {}, after=after, limit=101)
+    yield "shifts keyset page", sql, params
+
+    where, params = shift_queries.parse_filters(MultiDict({"employee_id": "1", "from": str(today - timedelta(days=60))}))
+    sql, params = shift_queries.build_query(where, params, limit=101)
+    yield "shifts by employee", sql, params
+
+    yield "sync windows", EMPLOYEE_SYNC_WINDOWS_QUERY.format(where="e.is_active = TRUE"), {"min_interval": 300, "mode": "window", "use_watermark": True}
+
+    # A delta page as upsert_staged_shifts sends it: VALUES rows expanded like execute_values
+    day = today - timedelta(days=3)
+    rows = [(1, f"C{n}", day, time(11), time(14, 30), "Front", "Lunch", 3.5, 0) for n in range(1, 4)]
+    values = b",".join(cursor.mogrify(STAGED_SHIFTS_UPSERT_TEMPLATE, row) for row in rows)
+    yield "delta upsert", cursor.mogrify(STAGED_SHIFTS_UPSERT, (AsIs(values.decode()),)).decode(), None
+
+    sql, params = staged_queries.build_query(limit=101)
+    yield "staged first page", sql, params
+
+    since = datetime.now(timezone.utc) - timedelta(hours=1)
+    sql, params = staged_queries.build_query(since=since, limit=101)
+    yield "staged since", sql, params
+
+    sql, params = staged_queries.build_query(limit=101, review=True)
+    yield "staged needs review", sql, params
+
+    sql, params = hours_summary.build_query(MultiDict({"period": "biweekly", "from": str(today - timedelta(days=28))}))
+    yield "hours summary", sql, params
+
+    params = {"employee_ids": [1, 2], "shift_dates": [today - timedelta(days=7), today]}
+    yield "hours refresh delete", cursor.mogrify(hours_summary.REFRESH_DELETE, params).decode(), None
+    yield "hours refresh insert", cursor.mogrify(hours_summary.REFRESH_INSERT, params).decode(), None
+
+
+def seq_scans(plan):
+    """Large tables read by a Seq Scan anywhere in an EXPLAIN (FORMAT JSON) plan."""
+    found = []
+    if plan.get("Node Type") == "Seq Scan" and plan.get("Relation Name") in LARGE_TABLES:
+        found.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        found.extend(seq_scans(child))
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="EXPLAIN the app's hot queries against a seeded database")
+    parser.add_argument("--setup", action="store_true", help="drop, recreate and seed the tbc schema first")
+    parser.add_argument("--employees", type=int, default=40)
+    parser.add_argument("--days", type=int, default=3 * 365, help="days of shift history to seed")
+    parser.add_argument("--verbose", action="store_true", help="print every plan")
+    args = parser.parse_args(argv)
+
+    dsn = os.getenv("BENCH_DATABASE_URL")
+    if not dsn:
+        sys.exit("Set BENCH_DATABASE_URL to a throwaway local database (never the Supabase one)")
+    if args.setup:
+        seed(dsn, args.employees, args.days)
+    os.environ.setdefault("DATABASE_URL", dsn)
+
+    failures = 0
+    with psycopg2.connect(dsn) as conn, conn.cursor() as cursor:
+        for name, sql, params in hot_queries(cursor):
+            cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+            plan = cursor.fetchone()[0][0]["Plan"]
+            scans = seq_scans(plan)
+            print(f"{'FAIL' if scans else 'ok':<5} {name:<22} cost {plan['Total Cost']:>10.1f}"
+                  + (f"  seq scan on {', '.join(sorted(set(scans)))}" if scans else ""))
+            if args.verbose or scans:
+                cursor.execute("EXPLAIN " + sql, params)
+                print("\n".join("      " + row[0] for row in cursor.fetchall()))
+            failures += bool(scans)
+        conn.rollback()
+    if failures:
+        sys.exit(f"{failures} hot quer{'y' if failures == 1 else 'ies'} fell back to a sequential scan")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""Local stand-in for the Clover shifts API, for benchmarks and offline runs.
+
+Serves GET /v3/merchants/<merchant>/employees/<clover_employee_id>/shifts with
+deterministic generated shifts, honouring the filters the app sends
+(has_in_time, in_and_override_time >/<, modifiedTime >=) and limit/offset
+paging. Latency, a page-size cap and 429 injection are configurable, and
+--ignore-filter modifiedTime mimics a Clover that drops that filter (the app
+then falls back from delta to window fetches).
+
+Run standalone and point the app at it:
+    python -m benchmarks.fake_clover --port 8099 --employees 20 --shifts 120 --latency-ms 80
+    CLOVER_BASE_URL=http://127.0.0.1:8099/v3/merchants flask --app app run
+Clover employee ids are E1..E<employees>.
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+SHIFTS_PATH = re.compile(r"^/v3/merchants/([^/]+)/employees/([^/]+)/shifts$")
+FILTER = re.compile(r"^(\w+)(>=|<=|>|<|=)(.*)$")
+
+HOUR_MS = 3600 * 1000
+DAY_MS = 24 * HOUR_MS
+
+
+def generate_shifts(clover_emp_id, count, now_ms, seed=0):
+    """One shift a day going back `count` days, a few with overrides or late edits.
+
+    The newest shift is left open (no outTime) for roughly one employee in five.
+    """
+    rng = random.Random(f"{seed}:{clover_emp_id}")
+    midnight = now_ms - now_ms % DAY_MS
+    shifts = []
+    for i in range(count, 0, -1):
+        in_ms = midnight - i * DAY_MS + rng.randint(15, 26) * HOUR_MS // 2  # 07:30..13:00 UTC-ish
+        out_ms = in_ms + rng.randint(6, 18) * HOUR_MS // 2
+        shift = {
+            "id": f"{clover_emp_id}S{i:05d}",
+            "employee": {"id": clover_emp_id},
+            "inTime": in_ms,
+            "outTime": out_ms,
+            "modifiedTime": out_ms + rng.randint(1, 600) * 1000,
+        }
+        if rng.random() < 0.05:
+            # Manager override applied at payroll review, days later
+            shift["overrideOutTime"] = out_ms + 15 * 60 * 1000
+            shift["modifiedTime"] = min(now_ms, out_ms + rng.randint(1, 5) * DAY_MS)
+        shifts.append(shift)
+    if shifts and rng.random() < 0.2:
+        del shifts[-1]["outTime"]
+        shifts[-1]["modifiedTime"] = shifts[-1]["inTime"]
+    return shifts
+
+
+def _field(shift, name):
+    if name == "in_and_override_time":
+        return shift.get("overrideInTime") or shift.get("inTime")
+    if name == "out_and_override_time":
+        return shift.get("overrideOutTime") or shift.get("outTime")
+    return shift.get(name)
+
+
+def apply_filters(shifts, filters, ignored=()):
+    for expr in filters:
+        match = FILTER.match(expr)
+        if not match:
+            raise ValueError(f"bad filter: {expr}")
+        name, op, value = match.groups()
+        if name in ignored:
+            continue
+        if name == "has_in_time":
+            want = value == "true"
+            shifts = [s for s in shifts if bool(s.get("inTime")) == want]
+            continue
+        value = int(value)
+        compare = {
+            ">": lambda a: a > value, ">=": lambda a: a >= value,
+            "<": lambda a: a < value, "<=": lambda a: a <= value,
+            "=": lambda a: a == value,
+        }[op]
+        shifts = [s for s in shifts if _field(s, name) is not None and compare(_field(s, name))]
+    return shifts
+
+
+class FakeClover:
+    """Generated data plus request counters; `serve()` starts it on a daemon thread."""
+
+    def __init__(self, employees=20, shifts=60, latency_ms=0.0, jitter_ms=0.0,
+                 max_page_size=1000, throttle_every=0, retry_after=1, seed=0, ignored_filters=()):
+        self.latency_ms = latency_ms
+        self.ignored_filters = frozenset(ignored_filters)  # filter fields accepted but not applied
+        self.jitter_ms = jitter_ms
+        self.max_page_size = max_page_size
+        self.throttle_every = throttle_every  # answer every Nth request with 429 (0 = never)
+        self.retry_after = retry_after
+        now_ms = int(time.time() * 1000)
+        self.shifts = {
+            f"E{n}": generate_shifts(f"E{n}", shifts, now_ms, seed)
+            for n in range(1, employees + 1)
+        }
+        self.requests = 0
+        self.throttled = 0
+        self.shifts_served = 0
+        self._lock = threading.Lock()
+        self.server = None
+
+    def employee_ids(self):
+        return list(self.shifts)
+
+    def edit_shifts(self, fraction=0.02, seed=1):
+        """Bump modifiedTime (and clock-out) on a random fraction of shifts, as late edits would."""
+        rng = random.Random(seed)
+        now_ms = int(time.time() * 1000)
+        edited = 0
+        for shifts in self.shifts.values():
+            for shift in shifts:
+                if shift.get("outTime") and rng.random() < fraction:
+                    shift["overrideOutTime"] = shift["outTime"] + 30 * 60 * 1000
+                    shift["modifiedTime"] = now_ms
+                    edited += 1
+        return edited
+
+    def stats(self):
+        with self._lock:
+            return {"requests": self.requests, "throttled": self.throttled, "shifts_served": self.shifts_served}
+
+    def reset_stats(self):
+        with self._lock:
+            self.requests = self.throttled = self.shifts_served = 0
+
+    def handle(self, path, query):
+        """Return (status, headers, body dict) for one request."""
+        with self._lock:
+            self.requests += 1
+            throttle = self.throttle_every and self.requests % self.throttle_every == 0
+            if throttle:
+                self.throttled += 1
+        if self.latency_ms or self.jitter_ms:
+            time.sleep(max(0.0, self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000)
+        if throttle:
+            return 429, {"Retry-After": str(self.retry_after)}, {"message": "Too Many Requests"}
+
+        match = SHIFTS_PATH.match(path)
+        if not match or match.group(2) not in self.shifts:
+            return 404, {}, {"message": "Not Found"}
+        params = parse_qs(query)
+        try:
+            shifts = apply_filters(self.shifts[match.group(2)], params.get("filter", []), self.ignored_filters)
+            limit = min(int(params.get("limit", ["100"])[0]), self.max_page_size)
+            offset = int(params.get("offset", ["0"])[0])
+        except ValueError as e:
+            return 400, {}, {"message": str(e)}
+        page = shifts[offset:offset + limit]
+        with self._lock:
+            self.shifts_served += len(page)
+        return 200, {}, {"elements": page}
+
+    def serve(self, host="127.0.0.1", port=0):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                status, headers, body = fake.handle(url.path, url.query)
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v3/merchants"
+
+    def shutdown(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--employees", type=int, default=20)
+    parser.add_argument("--shifts", type=int, default=60, help="shifts per employee")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--max-page-size", type=int, default=1000)
+    parser.add_argument("--throttle-every", type=int, default=0, help="answer every Nth request with 429")
+    parser.add_argument("--ignore-filter", action="append", default=[], metavar="FIELD",
+                        help="accept but do not apply filters on FIELD (e.g. modifiedTime)")
+    args = parser.parse_args(argv)
+
+    fake = FakeClover(args.employees, args.shifts, args.latency_ms, args.jitter_ms,
+                      args.max_page_size, args.throttle_every,
+                      ignored_filters=args.ignore_filter).serve(args.host, args.port)
+    print(f"Fake Clover serving {args.employees} employees x {args.shifts} shifts at {fake.base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fake.shutdown()
+
+
+if __name__ == "__main__":
+    main()
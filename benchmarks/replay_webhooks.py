@@ -0,0 +1,103 @@
+"""Replay Clover webhook payloads through the app against the local Clover stand-in.
+
+Posts each payload to /api/clover/webhook (with a valid X-Clover-Auth), waits
+for the background writer to flush, and reports what was staged and how many
+Clover requests it took, next to the requests a delta bulk sync would make.
+
+Payloads come from --file (one webhook body per line, e.g. captured from a
+real merchant) or, by default, are generated: a few percent of the fake
+shifts are edited and one employee event is sent per edit.
+
+Uses the same throwaway database as bench_sync (run bench_sync --setup first):
+    BENCH_DATABASE_URL=postgresql://localhost/tbc_bench python -m benchmarks.replay_webhooks --employees 40
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from benchmarks.fake_clover import FakeClover
+from utils import metrics
+
+WEBHOOK_AUTH = "bench-webhook-auth"
+MERCHANT_ID = "BENCHMERCHANT"
+
+
+def generated_payloads(fake, fraction, seed):
+    # One event per edited shift, as Clover sends them: a burst per employee
+    edited_after = int(time.time() * 1000)
+    fake.edit_shifts(fraction, seed=seed)
+    payloads = []
+    for clover_emp_id, shifts in fake.shifts.items():
+        for shift in shifts:
+            if shift["modifiedTime"] >= edited_after:
+                payloads.append({
+                    "appId": "BENCHAPP",
+                    "merchants": {MERCHANT_ID: [
+                        {"objectId": f"E:{clover_emp_id}", "type": "UPDATE", "ts": shift["modifiedTime"]}
+                    ]},
+                })
+    return payloads
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay Clover webhooks against the fake Clover")
+    parser.add_argument("--file", help="JSONL of webhook bodies to replay instead of generated ones")
+    parser.add_argument("--employees", type=int, default=20)
+    parser.add_argument("--shifts", type=int, default=90, help="shifts per employee")
+    parser.add_argument("--edit-fraction", type=float, default=0.02)
+    parser.add_argument("--flush-seconds", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    dsn = os.getenv("BENCH_DATABASE_URL")
+    if not dsn:
+        sys.exit("Set BENCH_DATABASE_URL to a throwaway local database (never the Supabase one)")
+
+    fake = FakeClover(args.employees, args.shifts).serve()
+    # app reads its configuration at import time
+    os.environ.update({
+        "DATABASE_URL": dsn,
+        "MERCHANT_ID": MERCHANT_ID,
+        "AUTHORIZATION_TOKEN": "bench",
+        "CLOVER_BASE_URL": fake.base_url,
+        "CLOVER_WEBHOOK_AUTH": WEBHOOK_AUTH,
+        "CLOVER_WEBHOOK_FLUSH_SECONDS": str(args.flush_seconds),
+    })
+    import app
+
+    if args.file:
+        with open(args.file, encoding="utf-8") as f:
+            payloads = [json.loads(line) for line in f if line.strip()]
+    else:
+        payloads = generated_payloads(fake, args.edit_fraction, args.seed)
+
+    client = app.app.test_client()
+    fake.reset_stats()
+    started = time.perf_counter()
+    latencies = []
+    for payload in payloads:
+        sent = time.perf_counter()
+        response = client.post("/api/clover/webhook", json=payload, headers={"X-Clover-Auth": WEBHOOK_AUTH})
+        latencies.append(time.perf_counter() - sent)
+        if response.status_code != 200:
+            sys.exit(f"webhook returned {response.status_code}: {response.get_data(as_text=True)}")
+    acked = time.perf_counter() - started
+    app.webhook_batcher.drain()
+    elapsed = time.perf_counter() - started
+
+    events = app.clover_webhook.WEBHOOK_EVENTS
+    served = fake.stats()
+    slowest = max(latencies) * 1000 if latencies else 0.0
+    print(f"{len(payloads)} payloads acked in {acked:.2f}s (slowest {slowest:.1f}ms), staged after {elapsed:.2f}s")
+    print(f"events: {events.value(outcome='queued')} queued, {events.value(outcome='ignored')} ignored, "
+          f"{events.value(outcome='dropped')} dropped")
+    print(f"clover: {served['requests']} requests, {served['shifts_served']} shifts "
+          f"(a delta bulk sync asks about all {len(fake.employee_ids())} employees)")
+    print(f"db: {metrics.DB_QUERY_SECONDS.count(statement='WITH')} upserts")
+    fake.shutdown()
+
+
+if __name__ == "__main__":
+    main()
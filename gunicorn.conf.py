@@ -0,0 +1,42 @@
+"""Gunicorn settings (loaded by the Procfile).
+
+Clover calls spend nearly all their time waiting on the network, so a worker
+must keep serving other requests while some are blocked on Clover. Two modes,
+picked with GUNICORN_WORKER_CLASS:
+
+  gthread (default)  a pool of GUNICORN_THREADS threads per worker.
+  gevent             one greenlet per request, for dozens of in-flight Clover
+                     fetches per worker. gevent patches sockets, so requests
+                     (the Clover client) yields while waiting, and psycogreen
+                     does the same for psycopg2 (both in requirements.txt).
+
+Either way routes and responses are unchanged. Keep a single worker process:
+sync jobs, caches and the webhook queue live in-process (see utils/sync_jobs.py).
+
+Routes and the webhook writer only hold a DB connection while they query,
+never across a Clover call; a running bulk sync holds one for its whole run.
+Unless DB_POOL_MAX is set, the pool is sized for that: one connection per
+request that can run at once (threads, or GUNICORN_DB_CONNECTIONS under
+gevent, where most requests are waiting on Clover rather than the database)
+plus two for the sync job and the webhook writer.
+"""
+import os
+
+# Not WEB_CONCURRENCY: hosts set that on their own, and a second worker would
+# miss jobs polled from the first and keep its own caches and webhook queue.
+workers = 1
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.getenv("GUNICORN_THREADS", "16"))
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "100"))  # gevent only
+
+# Read by utils/db.py when each worker opens its pool
+db_requests = int(os.getenv("GUNICORN_DB_CONNECTIONS", "20")) if worker_class == "gevent" else threads
+os.environ.setdefault("DB_POOL_MAX", str(db_requests + 2))
+
+
+def post_worker_init(worker):
+    if worker_class == "gevent":
+        # gevent has patched the stdlib by now; make psycopg2 wait on the hub too
+        from psycogreen.gevent import patch_psycopg
+
+        patch_psycopg()
@@ -0,0 +1,31 @@
+import pytest
+
+from benchmarks.fake_clover import DAY_MS, FakeClover
+from utils.clover_client import CloverClient
+
+
+@pytest.fixture
+def capped_clover():
+    # Serves at most 100 shifts a page, whatever limit the client asks for
+    fake = FakeClover(employees=1, shifts=250, max_page_size=100).serve()
+    client = CloverClient("TESTMERCHANT", "test", base_url=fake.base_url)
+    yield fake, client
+    client.close()
+    fake.shutdown()
+
+
+@pytest.mark.parametrize("prefetch", [True, False])
+def test_shift_pages_follow_short_pages(capped_clover, prefetch):
+    fake, client = capped_clover
+    expected = [s["id"] for s in fake.shifts["E1"]]
+    pages = list(client.iter_shift_pages("E1", 0, 2 ** 62, prefetch=prefetch))
+    assert [len(page) for page in pages] == [100, 100, 50]
+    assert [s["id"] for page in pages for s in page] == expected
+
+
+@pytest.mark.parametrize("prefetch", [True, False])
+def test_modified_shift_pages_follow_short_pages(capped_clover, prefetch):
+    fake, client = capped_clover
+    since_ms = min(s["modifiedTime"] for s in fake.shifts["E1"]) - DAY_MS
+    shifts = [s for page in client.iter_modified_shift_pages("E1", since_ms, prefetch=prefetch) for s in page]
+    assert len(shifts) == 250
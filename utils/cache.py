@@ -0,0 +1,81 @@
+import threading
+import time
+
+
+class TTLCache:
+    """Small in-process cache with per-entry expiry and explicit invalidation.
+
+    Each gunicorn worker keeps its own copy, so the TTL bounds how stale a
+    worker can be after a write handled by another worker (or made directly
+    in Supabase). Within a worker, a load that overlaps an invalidation is
+    returned to its caller but not stored, since it may predate the write.
+    """
+
+    def __init__(self, ttl, maxsize=256):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = {}  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._load_locks = {}  # key -> [lock, callers using it]
+        self._generation = 0  # bumped by every invalidation
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.hits += 1
+                return entry[1]
+        return None
+
+    def set(self, key, value):
+        with self._lock:
+            if len(self._entries) >= self.maxsize and key not in self._entries:
+                # Drop the entry closest to expiry
+                oldest = min(self._entries, key=lambda k: self._entries[k][0])
+                del self._entries[oldest]
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+
+    def get_or_load(self, key, loader):
+        value = self.get(key)
+        if value is not None:
+            return value
+        # Serialise loads per key so a burst of misses hits the database once,
+        # without making loads of other keys wait
+        with self._lock:
+            slot = self._load_locks.setdefault(key, [threading.Lock(), 0])
+            slot[1] += 1
+        try:
+            with slot[0]:
+                value = self.get(key)
+                if value is not None:
+                    return value
+                with self._lock:
+                    self.misses += 1
+                    generation = self._generation
+                value = loader()
+                with self._lock:
+                    stale = generation != self._generation
+                if not stale:
+                    self.set(key, value)
+                return value
+        finally:
+            with self._lock:
+                slot[1] -= 1
+                if not slot[1]:
+                    del self._load_locks[key]
+
+    def invalidate(self, key=None):
+        with self._lock:
+            self._generation += 1
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def invalidate_where(self, predicate):
+        with self._lock:
+            self._generation += 1
+            for key in [k for k in self._entries if predicate(k)]:
+                del self._entries[key]
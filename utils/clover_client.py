@@ -0,0 +1,268 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils import metrics
+from utils.metrics import log_event
+
+CLOVER_BASE_URL = "https://api.clover.com/v3/merchants"
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+SHIFT_PAGE_SIZE = 1000  # Clover's maximum page size
+
+# Shift field holding Clover's last-modified timestamp (epoch ms), used for delta syncs.
+# Clover's shift docs only list in/out-time filters, so whether the shifts endpoint
+# honours a filter on this field is checked at run time (probe_modified_filter) and
+# every delta page is verified against it; callers fall back to window fetches.
+SHIFT_MODIFIED_FIELD = "modifiedTime"
+
+Params = Sequence[Tuple[str, Any]]
+Timeout = Union[float, Tuple[float, float]]
+
+
+class CloverAPIError(Exception):
+    """Clover answered with a non-2xx status after all retries."""
+
+    def __init__(self, status_code: int, text: str, url: str = ""):
+        super().__init__(f"Clover API returned {status_code} for {url}: {text[:200]}")
+        self.status_code = status_code
+        self.text = text
+        self.url = url
+
+
+class UnsupportedFilterError(CloverAPIError):
+    """Clover answered, but ignored a filter: the page holds shifts it should have excluded."""
+
+    def __init__(self, field: str, url: str = ""):
+        super().__init__(200, f"Clover ignored the {field} filter", url)
+        self.field = field
+
+
+class CloverClient:
+    """Shared HTTP client for the Clover REST API.
+
+    One instance owns a pooled `requests.Session`, so every call to the same
+    merchant reuses a handful of keep-alive TCP/TLS connections instead of
+    opening one per request. Responses are gzip-negotiated, every call has a
+    (connect, read) timeout, and 429/5xx/connection errors are retried with
+    exponential backoff plus jitter, honouring `Retry-After` when Clover
+    sends it.
+    """
+
+    def __init__(
+        self,
+        merchant_id: str,
+        access_token: str,
+        base_url: str = CLOVER_BASE_URL,
+        timeout: Timeout = (5.0, 30.0),
+        max_retries: int = 4,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+        pool_maxsize: int = 10,
+        rate_limiter=None,
+    ):
+        self.merchant_id = merchant_id
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_limiter = rate_limiter
+        # Whether Clover honours the SHIFT_MODIFIED_FIELD filter; None until a probe
+        # or a delta page has shown it either way
+        self.modified_filter_supported: Optional[bool] = None
+
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"Bearer {access_token}",
+            "Accept": "application/json",
+            "Accept-Encoding": "gzip, deflate",
+        })
+        # Retries are handled in get() so Retry-After and jitter apply to every status
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def url(self, path: str) -> str:
+        return f"{self.base_url}/{self.merchant_id}/{path.lstrip('/')}"
+
+    def _retry_delay(self, attempt: int, response: Optional[requests.Response]) -> float:
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after:
+                try:
+                    return min(float(retry_after), self.backoff_max)
+                except ValueError:
+                    try:
+                        when = parsedate_to_datetime(retry_after)
+                        delay = (when - datetime.now(timezone.utc)).total_seconds()
+                        return min(max(delay, 0.0), self.backoff_max)
+                    except (TypeError, ValueError):
+                        pass
+        # Full jitter: uniform(0, base * 2^attempt), capped
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def get(self, path: str, params: Optional[Params] = None, timeout: Optional[Timeout] = None) -> requests.Response:
+        """GET `path` under the merchant, retrying transient failures.
+
+        Returns the final response whatever its status; callers that want an
+        exception on non-2xx should use `get_json`.
+        """
+        url = self.url(path)
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                waited = time.perf_counter()
+                self.rate_limiter.acquire()
+                metrics.CLOVER_RATE_LIMIT_WAIT_SECONDS.observe(time.perf_counter() - waited)
+            response = None
+            started = time.perf_counter()
+            try:
+                response = self.session.get(url, params=params, timeout=timeout or self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                metrics.CLOVER_REQUEST_SECONDS.observe(time.perf_counter() - started, status="error")
+                if attempt >= self.max_retries:
+                    raise
+                metrics.CLOVER_RETRIES.inc(reason=type(e).__name__)
+                log_event("clover.retry", level="warning", url=url, attempt=attempt + 1, error=str(e))
+            else:
+                metrics.CLOVER_REQUEST_SECONDS.observe(time.perf_counter() - started, status=str(response.status_code))
+                if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                    return response
+                metrics.CLOVER_RETRIES.inc(reason=str(response.status_code))
+                log_event("clover.retry", level="warning", url=url, attempt=attempt + 1, status=response.status_code)
+            time.sleep(self._retry_delay(attempt, response))
+            attempt += 1
+
+    def get_json(self, path: str, params: Optional[Params] = None, timeout: Optional[Timeout] = None) -> Dict[str, Any]:
+        response = self.get(path, params=params, timeout=timeout)
+        if response.status_code != 200:
+            raise CloverAPIError(response.status_code, response.text, response.url)
+        return response.json()
+
+    def iter_shift_pages(
+        self,
+        clover_emp_id: str,
+        start_ms: int,
+        end_ms: int,
+        page_size: int = SHIFT_PAGE_SIZE,
+        prefetch: bool = True,
+        timeout: Optional[Timeout] = None,
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """Lazily walk Clover's offset pagination, yielding one page of shifts at a time.
+
+        With `prefetch`, the next page is requested on a background thread while
+        the caller is still processing the current one. Only one or two pages are
+        ever held in memory, however long the window.
+        """
+        filters = [
+            ("filter", "has_in_time=true"),
+            ("filter", f"in_and_override_time>{start_ms}"),
+            ("filter", f"in_and_override_time<{end_ms}"),
+        ]
+        return self._iter_pages(f"employees/{clover_emp_id}/shifts", filters, page_size, prefetch, timeout)
+
+    def iter_modified_shift_pages(
+        self,
+        clover_emp_id: str,
+        modified_since_ms: int,
+        page_size: int = SHIFT_PAGE_SIZE,
+        prefetch: bool = True,
+        timeout: Optional[Timeout] = None,
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """Like iter_shift_pages, but selects shifts Clover modified at or after `modified_since_ms`.
+
+        Edits to old shifts (late overrides, corrected clock-outs) show up here
+        however far back the shift itself was clocked in. Raises
+        UnsupportedFilterError on the first page holding a shift the filter
+        should have excluded, rather than walking an employee's whole history.
+        """
+        path = f"employees/{clover_emp_id}/shifts"
+        filters = [
+            ("filter", "has_in_time=true"),
+            ("filter", f"{SHIFT_MODIFIED_FIELD}>={modified_since_ms}"),
+        ]
+        for page in self._iter_pages(path, filters, page_size, prefetch, timeout):
+            if any((shift.get(SHIFT_MODIFIED_FIELD) or 0) < modified_since_ms for shift in page):
+                self.modified_filter_supported = False
+                raise UnsupportedFilterError(SHIFT_MODIFIED_FIELD, self.url(path))
+            self.modified_filter_supported = True
+            yield page
+
+    def probe_modified_filter(self, clover_emp_id: str, timeout: Optional[Timeout] = None) -> Optional[bool]:
+        """Whether Clover honours the SHIFT_MODIFIED_FIELD filter, judged from one employee.
+
+        Asks for one shift modified from now on: a Clover that ignores the filter
+        answers with an old one. An empty answer only counts once a plain request
+        shows the employee has shifts at all; otherwise returns None (ask another
+        employee). Known answers are kept for the life of the client.
+        """
+        if self.modified_filter_supported is None:
+            path = f"employees/{clover_emp_id}/shifts"
+            now_ms = int(time.time() * 1000)
+            page = self.get_json(path, params=[
+                ("filter", "has_in_time=true"),
+                ("filter", f"{SHIFT_MODIFIED_FIELD}>={now_ms}"),
+                ("limit", 1),
+            ], timeout=timeout).get("elements", [])
+            if page:
+                self.modified_filter_supported = all((s.get(SHIFT_MODIFIED_FIELD) or 0) >= now_ms for s in page)
+            elif self.get_json(path, params=[("filter", "has_in_time=true"), ("limit", 1)],
+                               timeout=timeout).get("elements"):
+                self.modified_filter_supported = True
+            if self.modified_filter_supported is not None:
+                log_event("clover.modified_filter", supported=self.modified_filter_supported,
+                          clover_employee_id=clover_emp_id)
+        return self.modified_filter_supported
+
+    def _iter_pages(
+        self,
+        path: str,
+        filters: Params,
+        page_size: int,
+        prefetch: bool,
+        timeout: Optional[Timeout],
+    ) -> Iterator[List[Dict[str, Any]]]:
+        base_params: List[Tuple[str, Any]] = [("expand", "employee"), *filters]
+
+        def fetch(offset: int) -> List[Dict[str, Any]]:
+            params = base_params + [("limit", page_size), ("offset", offset)]
+            return self.get_json(path, params=params, timeout=timeout).get("elements", [])
+
+        # Clover may serve fewer rows than the limit asked for, so a short page
+        # says nothing; only an empty one ends the results
+        if not prefetch:
+            offset = 0
+            while True:
+                page = fetch(offset)
+                if not page:
+                    return
+                yield page
+                offset += len(page)
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(fetch, 0)
+            offset = 0
+            while True:
+                page = future.result()
+                if not page:
+                    return
+                offset += len(page)
+                # Start fetching the next page before yielding this one
+                future = executor.submit(fetch, offset)
+                yield page
+
+    def iter_shifts(self, clover_emp_id: str, start_ms: int, end_ms: int, timeout: Optional[Timeout] = None) -> Iterator[Dict[str, Any]]:
+        """Yield the raw Clover shift objects clocked in between start_ms and end_ms."""
+        for page in self.iter_shift_pages(clover_emp_id, start_ms, end_ms, timeout=timeout):
+            yield from page
+
+    def close(self) -> None:
+        self.session.close()
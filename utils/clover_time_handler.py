@@ -1,17 +1,48 @@
 from datetime import datetime, time
+from functools import lru_cache
 import zoneinfo
 
+@lru_cache(maxsize=None)
+def get_zone(tz_str):
+    # ZoneInfo objects are immutable; build each one once per process
+    return zoneinfo.ZoneInfo(tz_str)
+
+UTC = get_zone('UTC')
+PACIFIC = get_zone('America/Los_Angeles')
+
 def epoch_to_readable(epoch_ms):
     # Convert milliseconds to seconds and localize
-    utc_dt = datetime.fromtimestamp(epoch_ms / 1000, tz=zoneinfo.ZoneInfo('UTC'))
-    pst_dt = utc_dt.astimezone(zoneinfo.ZoneInfo('America/Los_Angeles'))
+    utc_dt = datetime.fromtimestamp(epoch_ms / 1000, tz=UTC)
+    pst_dt = utc_dt.astimezone(PACIFIC)
     return {
         'utc': utc_dt.isoformat(),
         'pst': pst_dt.isoformat()
     }
 
+def epoch_to_readable_many(epochs):
+    # Batch variant of epoch_to_readable; returns one dict per epoch, in order
+    fromtimestamp = datetime.fromtimestamp
+    results = []
+    for epoch_ms in epochs:
+        utc_dt = fromtimestamp(epoch_ms / 1000, tz=UTC)
+        results.append({
+            'utc': utc_dt.isoformat(),
+            'pst': utc_dt.astimezone(PACIFIC).isoformat()
+        })
+    return results
+
 def readable_to_epoch(date_str, position, tz_str='America/Los_Angeles'):
-    tz = zoneinfo.ZoneInfo(tz_str)
+    # Results are memoized: a bulk sync asks for the same few day boundaries
+    # once per employee
+    return _readable_to_epoch(date_str, position, tz_str)
+
+def readable_to_epoch_many(dates, position, tz_str='America/Los_Angeles'):
+    # Batch variant of readable_to_epoch; repeated dates are computed once
+    return [_readable_to_epoch(date_str, position, tz_str) for date_str in dates]
+
+@lru_cache(maxsize=4096)
+def _readable_to_epoch(date_str, position, tz_str):
+    tz = get_zone(tz_str)
 
     # Accept both "YYYY-MM-DD" and "YYYY-MM-DDTHH:MM:SS±HH:MM" formats
     try:
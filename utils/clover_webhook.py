@@ -0,0 +1,121 @@
+import hmac
+import queue
+import threading
+import time
+from collections import namedtuple
+
+from utils import metrics
+from utils.metrics import log_event
+
+# Clover webhooks post {"appId", "merchants": {merchant_id: [{"objectId", "type", "ts"}]}}
+# with the app's auth code in X-Clover-Auth. Clock-ins and clock-outs arrive as
+# employee events ("E:<clover employee id>"); every other object type is ignored.
+AUTH_HEADER = "X-Clover-Auth"
+EMPLOYEE_PREFIX = "E"
+
+WEBHOOK_EVENTS = metrics.REGISTRY.register(metrics.Counter(
+    "clover_webhook_events_total", "Clover webhook events by outcome (queued, ignored, dropped).", ("outcome",)))
+
+WebhookEvent = namedtuple("WebhookEvent", "clover_employee_id ts type")
+
+
+def verify(header_value, secret):
+    """True when X-Clover-Auth matches the configured auth code (constant-time)."""
+    if not secret or not header_value:
+        return False
+    return hmac.compare_digest(header_value.encode(), secret.encode())
+
+
+def parse_events(payload, merchant_id=None):
+    """Employee events for our merchant from a webhook body; returns (events, ignored count)."""
+    events = []
+    ignored = 0
+    for merchant, entries in (payload.get("merchants") or {}).items():
+        for entry in entries or []:
+            prefix, _, object_id = str(entry.get("objectId", "")).partition(":")
+            if (merchant_id and merchant != merchant_id) or prefix != EMPLOYEE_PREFIX or not object_id \
+                    or entry.get("type") == "DELETE":
+                ignored += 1
+                continue
+            try:
+                ts = int(entry.get("ts") or time.time() * 1000)
+            except (TypeError, ValueError):
+                ignored += 1
+                continue
+            events.append(WebhookEvent(object_id, ts, entry.get("type")))
+    return events, ignored
+
+
+def coalesce(events):
+    """{clover_employee_id: earliest event ts}; one Clover fetch per employee per flush."""
+    earliest = {}
+    for event in events:
+        if event.clover_employee_id not in earliest or event.ts < earliest[event.clover_employee_id]:
+            earliest[event.clover_employee_id] = event.ts
+    return earliest
+
+
+class WebhookBatcher:
+    """Queue webhook events and hand them to `flush` in batches on a background thread.
+
+    The webhook only enqueues, so Clover gets its 200 straight away. The
+    writer waits `flush_interval` seconds after the first event of a batch,
+    then calls flush(coalesce(batch)) once for everything that arrived, so a
+    burst of clock-ins for one employee costs one Clover fetch and one upsert.
+    Events that do not fit in `max_pending` are dropped (and counted); the
+    next delta sync picks those shifts up.
+    """
+
+    def __init__(self, flush, flush_interval=2.0, max_pending=10000):
+        self.flush = flush
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, events):
+        """Enqueue without blocking; returns how many events were accepted."""
+        self._ensure_started()
+        accepted = 0
+        for event in events:
+            try:
+                self._queue.put_nowait(event)
+                accepted += 1
+            except queue.Full:
+                break
+        dropped = len(events) - accepted
+        WEBHOOK_EVENTS.inc(accepted, outcome="queued")
+        if dropped:
+            WEBHOOK_EVENTS.inc(dropped, outcome="dropped")
+            log_event("clover_webhook.dropped", level="warning", dropped=dropped)
+        return accepted
+
+    def drain(self):
+        """Block until every queued event has been flushed (replays and benchmarks)."""
+        self._queue.join()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="clover-webhook", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self.flush(coalesce(batch))
+            except Exception as e:
+                log_event("clover_webhook.flush_failed", level="error", events=len(batch), error=str(e))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
@@ -0,0 +1,125 @@
+from datetime import date, timedelta
+from itertools import accumulate
+
+from utils.shift_queries import QueryParamError
+
+# Staffing coverage for GET /api/analytics/coverage: staff-hours in each
+# weekday x time slot, broken down by work_area and by shift_label.
+#
+# Shifts are fetched as one row of parallel arrays (weekday, minute in,
+# minute out, work_area, shift_label) instead of one row per shift. Each shift
+# then costs two or four writes into a per-minute difference array over one
+# week; a prefix sum turns that into "staff on shift" per minute, summed per
+# slot. Work is O(shifts + minutes in a week) however long the shifts are.
+COVERAGE_QUERY = """
+    SELECT
+        array_agg(extract(isodow FROM s.shift_date)::integer - 1) AS weekday,
+        array_agg((extract(epoch FROM s.time_in) / 60)::integer) AS minute_in,
+        array_agg((extract(epoch FROM s.time_out) / 60)::integer) AS minute_out,
+        array_agg(COALESCE(s.work_area, '')) AS work_area,
+        array_agg(COALESCE(s.shift_label, '')) AS shift_label
+    FROM tbc.shifts_dummy_20250719 s
+    WHERE s.shift_date BETWEEN %(from)s AND %(to)s
+"""
+COVERAGE_FILTERS = {
+    "work_area": "s.work_area = %(work_area)s",
+    "employee_id": "s.employee_id = %(employee_id)s",
+}
+
+DAY_MINUTES = 24 * 60
+WEEK_MINUTES = 7 * DAY_MINUTES
+SLOT_MINUTES = (15, 30, 60)
+DEFAULT_RANGE_DAYS = 365
+MAX_RANGE_DAYS = 5 * 366
+
+
+def parse_args(args):
+    """Request args -> params dict; also the cache key (see cache_key)."""
+    try:
+        to = date.fromisoformat(args["to"]) if args.get("to") else date.today()
+        start = date.fromisoformat(args["from"]) if args.get("from") else to - timedelta(days=DEFAULT_RANGE_DAYS - 1)
+    except ValueError:
+        raise QueryParamError("'from' and 'to' must be YYYY-MM-DD")
+    if start > to:
+        raise QueryParamError("'from' must not be after 'to'")
+    if (to - start).days >= MAX_RANGE_DAYS:
+        raise QueryParamError(f"the range may span at most {MAX_RANGE_DAYS} days")
+    params = {"from": start, "to": to, "work_area": args.get("work_area") or None, "employee_id": None}
+    if args.get("employee_id"):
+        try:
+            params["employee_id"] = int(args["employee_id"])
+        except ValueError:
+            raise QueryParamError(f"invalid value for 'employee_id': {args['employee_id']}")
+    try:
+        params["slot_minutes"] = int(args.get("slot_minutes") or 30)
+    except ValueError:
+        params["slot_minutes"] = None
+    if params["slot_minutes"] not in SLOT_MINUTES:
+        raise QueryParamError(f"'slot_minutes' must be one of {', '.join(map(str, SLOT_MINUTES))}")
+    return params
+
+
+def cache_key(params):
+    # from/to come first so writes can invalidate by date (see covers)
+    return (params["from"], params["to"], params["work_area"], params["employee_id"], params["slot_minutes"])
+
+
+def covers(key, shift_dates):
+    return any(key[0] <= shift_date <= key[1] for shift_date in shift_dates)
+
+
+def build_query(params):
+    sql = COVERAGE_QUERY
+    for name, clause in COVERAGE_FILTERS.items():
+        if params[name] is not None:
+            sql += " AND " + clause
+    return sql, params
+
+
+def weekday_counts(start, to):
+    """How many Mondays..Sundays the range holds, for per-day averages."""
+    days = (to - start).days + 1
+    counts = [days // 7] * 7
+    for offset in range(days % 7):
+        counts[(start.weekday() + offset) % 7] += 1
+    return counts
+
+
+def _grids(diffs, slot_minutes):
+    slots_per_day = DAY_MINUTES // slot_minutes
+    grids = {}
+    for key, diff in diffs.items():
+        on_shift = list(accumulate(diff[:WEEK_MINUTES]))  # staff on shift in each minute of the week
+        slots = [round(sum(on_shift[i:i + slot_minutes]) / 60, 2) for i in range(0, WEEK_MINUTES, slot_minutes)]
+        grids[key] = [slots[day * slots_per_day:(day + 1) * slots_per_day] for day in range(7)]
+    return grids
+
+
+def compute(row, slot_minutes):
+    """Coverage grids from the COVERAGE_QUERY row: {breakdown: {key: 7 x slots of staff-hours}}."""
+    weekday = row["weekday"] or []
+    by_area, by_label = {}, {}
+    for day, minute_in, minute_out, area, label in zip(
+            weekday, row["minute_in"] or [], row["minute_out"] or [], row["work_area"] or [], row["shift_label"] or []):
+        duration = (minute_out - minute_in) % DAY_MINUTES  # past midnight wraps round
+        if not duration:
+            continue
+        start = day * DAY_MINUTES + minute_in
+        end = start + duration
+        for diffs, key in ((by_area, area), (by_label, label)):
+            diff = diffs.get(key)
+            if diff is None:
+                diff = diffs[key] = [0] * (WEEK_MINUTES + 1)
+            diff[start] += 1
+            if end <= WEEK_MINUTES:
+                diff[end] -= 1
+            else:
+                # Sunday night into Monday morning
+                diff[WEEK_MINUTES] -= 1
+                diff[0] += 1
+                diff[end - WEEK_MINUTES] -= 1
+    return {
+        "shifts": len(weekday),
+        "by_work_area": _grids(by_area, slot_minutes),
+        "by_shift_label": _grids(by_label, slot_minutes),
+    }
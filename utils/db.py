@@ -0,0 +1,362 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+
+from utils import metrics
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection frees up within the checkout timeout."""
+
+
+# Leading SQL keywords used as the `statement` metric label; anything else is OTHER
+STATEMENT_KEYWORDS = frozenset({
+    "SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "COPY", "CREATE", "ALTER", "DROP", "TRUNCATE",
+})
+
+
+def _statement(query):
+    head = query[:24].decode(errors="ignore") if isinstance(query, bytes) else str(query)[:24]
+    words = head.split(None, 1)
+    keyword = words[0].upper() if words else ""
+    return keyword if keyword in STATEMENT_KEYWORDS else "OTHER"
+
+
+def _observe(statement, started, cursor):
+    metrics.DB_QUERY_SECONDS.observe(time.perf_counter() - started, statement=statement)
+    if cursor.rowcount > 0:
+        metrics.DB_ROWS.inc(cursor.rowcount, statement=statement)
+
+
+_instrumented_cursors = {}
+
+
+def _instrumented_cursor(factory):
+    # Subclass whichever cursor class the caller asked for (plain, RealDictCursor, ...)
+    # so every statement is timed without touching the call sites
+    cls = _instrumented_cursors.get(factory)
+    if cls is not None:
+        return cls
+
+    def execute(self, query, vars=None):
+        statement = _statement(query)
+        started = time.perf_counter()
+        try:
+            return factory.execute(self, query, vars)
+        except Exception:
+            metrics.DB_ERRORS.inc(statement=statement)
+            raise
+        finally:
+            _observe(statement, started, self)
+
+    def executemany(self, query, vars_list):
+        statement = _statement(query)
+        started = time.perf_counter()
+        try:
+            return factory.executemany(self, query, vars_list)
+        except Exception:
+            metrics.DB_ERRORS.inc(statement=statement)
+            raise
+        finally:
+            _observe(statement, started, self)
+
+    def copy_expert(self, sql, file, size=8192):
+        started = time.perf_counter()
+        try:
+            return factory.copy_expert(self, sql, file, size)
+        except Exception:
+            metrics.DB_ERRORS.inc(statement="COPY")
+            raise
+        finally:
+            _observe("COPY", started, self)
+
+    cls = type(f"Instrumented{factory.__name__}", (factory,), {
+        "execute": execute, "executemany": executemany, "copy_expert": copy_expert,
+    })
+    _instrumented_cursors[factory] = cls
+    return cls
+
+
+class InstrumentedConnection(extensions.connection):
+    """psycopg2 connection whose cursors, commits and rollbacks feed utils.metrics."""
+
+    def cursor(self, *args, **kwargs):
+        factory = kwargs.pop("cursor_factory", None) or self.cursor_factory or extensions.cursor
+        return super().cursor(*args, cursor_factory=_instrumented_cursor(factory), **kwargs)
+
+    def commit(self):
+        with metrics.DB_QUERY_SECONDS.time(statement="COMMIT"):
+            return super().commit()
+
+    def rollback(self):
+        with metrics.DB_QUERY_SECONDS.time(statement="ROLLBACK"):
+            return super().rollback()
+
+
+class ConnectionPool:
+    """Thread-safe PostgreSQL connection pool.
+
+    Callers block (up to `timeout` seconds) when all `maxconn` connections are
+    checked out instead of failing straight away, so the time spent waiting can
+    be reported and used to size gunicorn workers against the Supabase pooler.
+    """
+
+    def __init__(self, dsn, minconn=1, maxconn=5, timeout=10.0, max_idle=60.0, max_lifetime=1800.0,
+                 connection_factory=None):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError("pool sizing must satisfy 0 <= minconn <= maxconn and maxconn >= 1")
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_idle = max_idle          # idle seconds after which a checkout runs SELECT 1 first
+        self.max_lifetime = max_lifetime  # connections older than this are replaced on checkout
+        self.connection_factory = connection_factory  # psycopg2 connection subclass, if any
+
+        self._cond = threading.Condition()
+        self._idle = deque()   # (conn, created_at, released_at)
+        self._in_use = {}      # id(conn) -> created_at
+        self._opening = 0      # slots reserved for connections being opened
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+            "timeouts": 0,
+            "created": 0,
+            "recycled": 0,
+        }
+
+        for _ in range(minconn):
+            conn = self._connect()
+            self._idle.append((conn, time.monotonic(), time.monotonic()))
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn, connection_factory=self.connection_factory)
+        with self._cond:
+            self._stats["created"] += 1
+        return conn
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._stats["recycled"] += 1
+
+    def _is_healthy(self, conn, created_at, released_at, now):
+        if conn.closed:
+            return False
+        if self.max_lifetime and now - created_at > self.max_lifetime:
+            return False
+        if self.max_idle is not None and now - released_at > self.max_idle:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                conn.rollback()
+            except psycopg2.Error:
+                return False
+        return True
+
+    def getconn(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+
+        with self._cond:
+            while True:
+                if self._idle:
+                    # LIFO so the most recently used (warmest) connection is reused first
+                    conn, created_at, released_at = self._idle.pop()
+                    break
+                if len(self._in_use) + self._opening < self.maxconn:
+                    conn = None
+                    self._opening += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeout(f"no database connection available after {self.timeout}s")
+                waited = True
+                self._cond.wait(remaining)
+            if conn is not None:
+                # Reserve the slot while the health check runs outside the lock
+                self._opening += 1
+
+        now = time.monotonic()
+        if conn is not None and not self._is_healthy(conn, created_at, released_at, now):
+            self._discard(conn)
+            conn = None
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._opening -= 1
+                    self._cond.notify()
+                raise
+            created_at = time.monotonic()
+
+        with self._cond:
+            self._opening -= 1
+            self._in_use[id(conn)] = created_at
+            wait = time.monotonic() - start
+            self._stats["checkouts"] += 1
+            if waited:
+                self._stats["waits"] += 1
+            self._stats["wait_time_total"] += wait
+            self._stats["wait_time_max"] = max(self._stats["wait_time_max"], wait)
+        return conn
+
+    def putconn(self, conn, discard=False):
+        with self._cond:
+            created_at = self._in_use.pop(id(conn), None)
+        if created_at is None:
+            raise ValueError("connection does not belong to this pool")
+
+        if not discard and not conn.closed:
+            # Never hand the next caller a connection with an open or failed transaction
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+
+        if discard or conn.closed:
+            self._discard(conn)
+            with self._cond:
+                self._cond.notify()
+            return
+
+        with self._cond:
+            self._idle.append((conn, created_at, time.monotonic()))
+            self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+        for conn, _, _ in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def stats(self):
+        with self._cond:
+            s = dict(self._stats)
+            in_use = len(self._in_use)
+            idle = len(self._idle)
+            opening = self._opening
+        checkouts = s["checkouts"] or 1
+        return {
+            "min": self.minconn,
+            "max": self.maxconn,
+            "in_use": in_use,
+            "idle": idle,
+            "opening": opening,
+            "checkouts": s["checkouts"],
+            "waits": s["waits"],
+            "timeouts": s["timeouts"],
+            "wait_time_total_ms": round(s["wait_time_total"] * 1000, 3),
+            "wait_time_avg_ms": round(s["wait_time_total"] * 1000 / checkouts, 3),
+            "wait_time_max_ms": round(s["wait_time_max"] * 1000, 3),
+            "created": s["created"],
+            "recycled": s["recycled"],
+        }
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide pool, creating it on first use.
+
+    The pool is keyed on the PID so each gunicorn worker opens its own
+    connections after fork instead of sharing sockets with the master.
+    """
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is not None and _pool_pid == pid:
+        return _pool
+    with _pool_lock:
+        if _pool is None or _pool_pid != pid:
+            _pool = ConnectionPool(
+                os.getenv("DATABASE_URL"),
+                minconn=int(os.getenv("DB_POOL_MIN", "1")),
+                maxconn=int(os.getenv("DB_POOL_MAX", "5")),
+                timeout=float(os.getenv("DB_POOL_TIMEOUT", "10")),
+                max_idle=float(os.getenv("DB_POOL_MAX_IDLE", "60")),
+                max_lifetime=float(os.getenv("DB_POOL_MAX_LIFETIME", "1800")),
+                connection_factory=InstrumentedConnection,
+            )
+            _pool_pid = pid
+    return _pool
+
+
+@contextmanager
+def connection():
+    """Check out a pooled connection for the duration of a `with` block.
+
+    Uncommitted work is rolled back on exit; connections that raised an
+    OperationalError/InterfaceError are closed instead of being returned.
+    """
+    pool = get_pool()
+    conn = pool.getconn()
+    broken = False
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
+    finally:
+        pool.putconn(conn, discard=broken)
+
+
+def pool_stats():
+    if _pool is None or _pool_pid != os.getpid():
+        return None
+    return _pool.stats()
+
+
+def _collect_pool_metrics():
+    stats = pool_stats()
+    if stats is None:
+        return []
+    return [
+        ("db_pool_connections", "gauge", "Pooled connections by state.",
+         [({"state": "in_use"}, stats["in_use"]), ({"state": "idle"}, stats["idle"])]),
+        ("db_pool_checkouts_total", "counter", "Connections checked out of the pool.", [({}, stats["checkouts"])]),
+        ("db_pool_waits_total", "counter", "Checkouts that had to wait for a free connection.", [({}, stats["waits"])]),
+        ("db_pool_wait_seconds_total", "counter", "Total time spent waiting for a connection.",
+         [({}, stats["wait_time_total_ms"] / 1000)]),
+        ("db_pool_timeouts_total", "counter", "Checkouts that gave up with PoolTimeout.", [({}, stats["timeouts"])]),
+    ]
+
+
+metrics.REGISTRY.add_collector(_collect_pool_metrics)
+
+
+def iter_query(sql, params=None, name="stream", itersize=500, types=()):
+    """Yield rows of `sql` from a server-side (named) cursor, `itersize` at a time.
+
+    The pooled connection is held until the generator is exhausted or closed,
+    so callers streaming a response never hold the whole result set. `types`
+    are psycopg2 typecasters to register on the cursor (e.g. serialization.ISO_TYPES).
+    """
+    with connection() as conn, conn.cursor(name=name) as cursor:
+        for typ in types:
+            extensions.register_type(typ, cursor)
+        cursor.itersize = itersize
+        cursor.execute(sql, params)
+        for row in cursor:
+            yield row
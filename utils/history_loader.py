@@ -0,0 +1,414 @@
+"""Stream historical timesheet / employee files into Postgres.
+
+Reads CSV or XLSX row by row, normalizes the date/time formats found in the
+exported sheets ("7/7/2023" + "5:00:00 PM" as well as ISO "2023-07-07" +
+"17:00:00"), validates every row, COPYs the good ones into a temp staging
+table and merges that into the target table in one statement. Rejected rows
+go to a sidecar CSV next to the input with the reason attached.
+
+Usage (from the repo root):
+    python -m utils.history_loader shifts tbc_timesheet.csv "shifts_SNAPSHOT_2025_04_20(tbc_timesheet).csv"
+    python -m utils.history_loader employees Employees.csv
+    python -m utils.history_loader shifts tbc_timesheet.xlsx --dry-run
+"""
+import argparse
+import csv
+import io
+import os
+import sys
+import time as timer
+from datetime import date, datetime, time
+from decimal import Decimal, InvalidOperation
+
+from dotenv import load_dotenv
+
+from utils import db
+from utils import hours_summary
+from utils import migrations
+
+SHIFTS_TABLE = "tbc.shifts_dummy_20250719"
+
+DATE_FORMATS = ("%Y-%m-%d", "%m/%d/%Y", "%m/%d/%y")
+TIME_FORMATS = ("%H:%M:%S", "%H:%M", "%I:%M:%S %p", "%I:%M %p")
+
+
+class RowError(ValueError):
+    """A row that cannot be loaded; written to the error sidecar."""
+
+
+# --- Readers -----------------------------------------------------------------
+
+def iter_csv(path):
+    # utf-8-sig drops the BOM Excel puts in front of the first header
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for line_no, row in enumerate(csv.DictReader(f), start=2):
+            yield line_no, row
+
+
+def iter_xlsx(path):
+    try:
+        import openpyxl
+    except ImportError:
+        raise SystemExit("openpyxl is required to read .xlsx files (pip install openpyxl)")
+    # read_only streams the sheet instead of building the whole workbook in memory
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = [str(h).strip() if h is not None else "" for h in next(rows, ())]
+        for line_no, values in enumerate(rows, start=2):
+            yield line_no, dict(zip(header, values))
+    finally:
+        workbook.close()
+
+
+def iter_rows(path):
+    reader = iter_xlsx if path.lower().endswith((".xlsx", ".xlsm")) else iter_csv
+    for line_no, row in reader(path):
+        if all(v in (None, "") for v in row.values()):
+            continue
+        yield line_no, row
+
+
+# --- Field parsers -------------------------------------------------------------
+
+def _blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def parse_date(value, field):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = str(value).strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    raise RowError(f"{field}: unrecognised date {value!r}")
+
+
+def parse_time(value, field):
+    if isinstance(value, datetime):
+        return value.time()
+    if isinstance(value, time):
+        return value
+    text = str(value).strip().upper()
+    for fmt in TIME_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).time()
+        except ValueError:
+            continue
+    raise RowError(f"{field}: unrecognised time {value!r}")
+
+
+def parse_int(value, field):
+    try:
+        return int(str(value).strip())
+    except ValueError:
+        raise RowError(f"{field}: not an integer {value!r}")
+
+
+def parse_decimal(value, field):
+    try:
+        return Decimal(str(value).strip()).quantize(Decimal("0.01"))
+    except InvalidOperation:
+        raise RowError(f"{field}: not a number {value!r}")
+
+
+def parse_bool(value, field):
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in ("yes", "y", "true", "t", "1"):
+        return True
+    if text in ("no", "n", "false", "f", "0"):
+        return False
+    raise RowError(f"{field}: expected Yes/No, got {value!r}")
+
+
+def _text(value):
+    return None if _blank(value) else str(value).strip()
+
+
+def _required(row, field):
+    value = row.get(field)
+    if _blank(value):
+        raise RowError(f"{field}: missing")
+    return value
+
+
+# --- Table specs -----------------------------------------------------------------
+
+class ShiftSpec:
+    name = "shifts"
+    columns = ("employee_id", "shift_date", "time_in", "time_out", "work_area", "shift_label", "decimal_hours", "notes")
+    stage_ddl = """
+        CREATE TEMP TABLE history_stage (
+            line_no INTEGER,
+            employee_id INTEGER,
+            shift_date DATE,
+            time_in TIME,
+            time_out TIME,
+            work_area TEXT,
+            shift_label TEXT,
+            decimal_hours NUMERIC(5, 2),
+            notes TEXT
+        ) ON COMMIT DROP
+    """
+    # Existing (employee_id, shift_date, time_in, time_out) rows are left alone,
+    # so re-running a file is a no-op
+    merge_sql = f"""
+        INSERT INTO {SHIFTS_TABLE} (
+            employee_id, shift_date, time_in, time_out, work_area,
+            shift_label, decimal_hours, notes
+        )
+        SELECT DISTINCT ON (st.employee_id, st.shift_date, st.time_in, st.time_out)
+            st.employee_id, st.shift_date, st.time_in, st.time_out, st.work_area,
+            st.shift_label, st.decimal_hours, st.notes
+        FROM history_stage st
+        WHERE NOT EXISTS (
+            SELECT 1 FROM {SHIFTS_TABLE} s
+            WHERE s.employee_id = st.employee_id
+              AND s.shift_date = st.shift_date
+              AND s.time_in = st.time_in
+              AND s.time_out = st.time_out
+        )
+        ORDER BY st.employee_id, st.shift_date, st.time_in, st.time_out, st.line_no
+        ON CONFLICT DO NOTHING
+    """
+
+    def __init__(self, cursor):
+        migrations.ensure_schema(cursor.connection)
+        cursor.execute("SELECT id FROM tbc.employees")
+        self.employee_ids = {row[0] for row in cursor.fetchall()}
+
+    def after_merge(self, cursor):
+        # Re-sum tbc.hours_summary for the employee-weeks this file touched
+        cursor.execute("SELECT DISTINCT employee_id, date_trunc('week', shift_date)::date FROM history_stage")
+        hours_summary.refresh(cursor, cursor.fetchall())
+
+    def normalize(self, row):
+        employee_id = parse_int(_required(row, "employee_id"), "employee_id")
+        if employee_id not in self.employee_ids:
+            raise RowError(f"employee_id: {employee_id} is not in tbc.employees")
+        shift_date = parse_date(_required(row, "shift_date"), "shift_date")
+        time_in = parse_time(_required(row, "time_in"), "time_in")
+        time_out = parse_time(_required(row, "time_out"), "time_out")
+        if _blank(row.get("decimal_hours")):
+            minutes = (time_out.hour * 60 + time_out.minute) - (time_in.hour * 60 + time_in.minute)
+            # A shift that ends after midnight wraps round
+            decimal_hours = Decimal(minutes % (24 * 60)) / 60
+            decimal_hours = decimal_hours.quantize(Decimal("0.01"))
+        else:
+            decimal_hours = parse_decimal(row["decimal_hours"], "decimal_hours")
+        return (
+            employee_id,
+            shift_date,
+            time_in,
+            time_out,
+            _text(row.get("work_area")),
+            _text(row.get("shift_label")),
+            decimal_hours,
+            _text(row.get("notes")),
+        )
+
+
+class EmployeeSpec:
+    name = "employees"
+    columns = ("id", "first_name", "preferred_name", "middle_name", "last_name", "role", "phone_number",
+               "email", "start_date", "end_date", "is_active", "position", "address")
+    stage_ddl = """
+        CREATE TEMP TABLE history_stage (
+            line_no INTEGER,
+            id INTEGER,
+            first_name TEXT,
+            preferred_name TEXT,
+            middle_name TEXT,
+            last_name TEXT,
+            role TEXT,
+            phone_number TEXT,
+            email TEXT,
+            start_date DATE,
+            end_date DATE,
+            is_active BOOLEAN,
+            position TEXT,
+            address TEXT
+        ) ON COMMIT DROP
+    """
+    merge_sql = """
+        INSERT INTO tbc.employees (
+            id, first_name, preferred_name, middle_name, last_name, role, phone_number,
+            email, start_date, end_date, is_active, position, address
+        )
+        SELECT DISTINCT ON (id)
+            id, first_name, preferred_name, middle_name, last_name, role, phone_number,
+            email, start_date, end_date, is_active, position, address
+        FROM history_stage
+        ORDER BY id, line_no
+        ON CONFLICT (id) DO NOTHING
+    """
+
+    def __init__(self, cursor):
+        pass
+
+    def normalize(self, row):
+        start_date = row.get("start_date")
+        end_date = row.get("end_date")
+        is_active = row.get("is_active")
+        return (
+            parse_int(_required(row, "id"), "id"),
+            _text(_required(row, "first_name")),
+            _text(row.get("preferred_name")),
+            _text(row.get("middle_name")),
+            _text(row.get("last_name")),
+            _text(row.get("role")),
+            _text(row.get("phone_number")),
+            _text(row.get("email")),
+            None if _blank(start_date) else parse_date(start_date, "start_date"),
+            None if _blank(end_date) else parse_date(end_date, "end_date"),
+            True if _blank(is_active) else parse_bool(is_active, "is_active"),
+            _text(row.get("position")),
+            _text(row.get("address")),
+        )
+
+
+SPECS = {"shifts": ShiftSpec, "employees": EmployeeSpec}
+
+
+# --- Loading ---------------------------------------------------------------------
+
+class CopySource:
+    """File-like object that renders rows to CSV on demand for COPY ... FROM STDIN.
+
+    copy_expert() pulls fixed-size chunks through read(), so only one chunk of
+    rows is ever materialized no matter how long the input is.
+    """
+
+    def __init__(self, rows):
+        self._rows = rows
+        self._out = io.StringIO()
+        self._writer = csv.writer(self._out, lineterminator="\n")
+        self._pending = ""
+
+    def read(self, size=-1):
+        while size < 0 or len(self._pending) < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            self._writer.writerow(["" if v is None else v for v in row])
+            if self._out.tell() >= 65536:
+                self._pending += self._out.getvalue()
+                self._out.seek(0)
+                self._out.truncate()
+        self._pending += self._out.getvalue()
+        self._out.seek(0)
+        self._out.truncate()
+        if size < 0:
+            size = len(self._pending)
+        chunk, self._pending = self._pending[:size], self._pending[size:]
+        return chunk
+
+
+
+class ErrorSidecar:
+    """Collects rejected rows in <input>.errors.csv, created on the first error."""
+
+    def __init__(self, source_path, errors_dir=None):
+        base = os.path.basename(source_path)
+        directory = errors_dir or os.path.dirname(os.path.abspath(source_path))
+        self.path = os.path.join(directory, os.path.splitext(base)[0] + ".errors.csv")
+        self.count = 0
+        self._file = None
+        self._writer = None
+
+    def write(self, line_no, row, error):
+        if self._writer is None:
+            self._file = open(self.path, "w", newline="", encoding="utf-8")
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(["line", "error"] + list(row.keys()))
+        self._writer.writerow([line_no, str(error)] + ["" if v is None else v for v in row.values()])
+        self.count += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+def load_file(conn, kind, path, errors_dir=None, progress_every=1000, dry_run=False):
+    """Stream one file into its target table; returns a summary dict."""
+    started = timer.monotonic()
+    sidecar = ErrorSidecar(path, errors_dir)
+    counts = {"read": 0, "staged": 0}
+
+    with conn.cursor() as cursor:
+        spec = SPECS[kind](cursor)
+
+        def staged_rows():
+            for line_no, row in iter_rows(path):
+                counts["read"] += 1
+                try:
+                    values = spec.normalize(row)
+                except RowError as e:
+                    sidecar.write(line_no, row, e)
+                else:
+                    counts["staged"] += 1
+                    yield (line_no,) + values
+                if progress_every and counts["read"] % progress_every == 0:
+                    elapsed = timer.monotonic() - started
+                    print(f"{path}: {counts['read']} rows read, {sidecar.count} rejected "
+                          f"({counts['read'] / elapsed:,.0f} rows/s)")
+
+        try:
+            cursor.execute(spec.stage_ddl)
+            columns = ", ".join(("line_no",) + spec.columns)
+            cursor.copy_expert(
+                f"COPY history_stage ({columns}) FROM STDIN WITH (FORMAT csv)",
+                CopySource(staged_rows()))
+            cursor.execute(spec.merge_sql)
+            merged = cursor.rowcount
+            if hasattr(spec, "after_merge"):
+                spec.after_merge(cursor)
+            if dry_run:
+                conn.rollback()
+            else:
+                conn.commit()
+        finally:
+            sidecar.close()
+
+    return {
+        "file": path,
+        "table": kind,
+        "read": counts["read"],
+        "staged": counts["staged"],
+        "inserted": merged,
+        "already_present": counts["staged"] - merged,
+        "rejected": sidecar.count,
+        "errors_file": sidecar.path if sidecar.count else None,
+        "seconds": round(timer.monotonic() - started, 2),
+        "dry_run": dry_run,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load historical timesheet/employee CSV or XLSX files.")
+    parser.add_argument("kind", choices=sorted(SPECS), help="what the files contain")
+    parser.add_argument("files", nargs="+", help="CSV or XLSX files, loaded in order")
+    parser.add_argument("--errors-dir", help="where to write <file>.errors.csv (default: next to the input)")
+    parser.add_argument("--progress", type=int, default=1000, help="report every N rows (0 to disable)")
+    parser.add_argument("--dry-run", action="store_true", help="validate and stage, then roll back")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    failed = False
+    with db.connection() as conn:
+        for path in args.files:
+            summary = load_file(conn, args.kind, path, args.errors_dir, args.progress, args.dry_run)
+            print(summary)
+            failed = failed or summary["rejected"] > 0
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
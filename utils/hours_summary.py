@@ -0,0 +1,149 @@
+import os
+from datetime import date, timedelta
+
+from utils.shift_queries import QueryParamError
+
+# Hours per employee, week, work_area and shift_label, pre-summed from
+# tbc.shifts_dummy_20250719. Weeks start on Monday (date_trunc('week')).
+# Biweekly pay periods are two of these weeks added together at read time, so
+# one table serves both period lengths. work_area/shift_label are stored as ''
+# when NULL so they can be part of the primary key. The table is created (and
+# first filled) by utils/migrations.py.
+
+# A Monday that starts a biweekly pay period; every other period is 14 days from it
+PAY_PERIOD_ANCHOR = date.fromisoformat(os.getenv("PAY_PERIOD_ANCHOR", "2023-01-02"))
+PAY_PERIOD_ANCHOR -= timedelta(days=PAY_PERIOD_ANCHOR.weekday())
+
+PERIODS = ("weekly", "biweekly")
+
+_SUM_SHIFTS = """
+    SELECT s.employee_id, date_trunc('week', s.shift_date)::date AS week_start,
+           COALESCE(s.work_area, ''), COALESCE(s.shift_label, ''),
+           COALESCE(SUM(s.decimal_hours), 0), COUNT(*)
+    FROM tbc.shifts_dummy_20250719 s
+"""
+_SUM_GROUP = "GROUP BY 1, 2, 3, 4"
+
+# The employee-weeks touched by a write, from parallel employee_id/shift_date arrays
+_AFFECTED = """
+    SELECT DISTINCT employee_id, date_trunc('week', shift_date)::date AS week_start
+    FROM unnest(%(employee_ids)s::integer[], %(shift_dates)s::date[]) AS t(employee_id, shift_date)
+"""
+
+# One transaction-scoped advisory lock per employee-week (two-key form, so it
+# cannot collide with the single-key migrations lock), taken in a fixed order
+_LOCK_AFFECTED = f"""
+    SELECT pg_advisory_xact_lock(a.employee_id, a.week_start - date '1970-01-05')
+    FROM ({_AFFECTED} ORDER BY employee_id, week_start) a
+"""
+
+# refresh() clears the affected employee-weeks, then re-sums their shifts
+REFRESH_DELETE = f"""
+    DELETE FROM tbc.hours_summary h
+    USING ({_AFFECTED}) a
+    WHERE h.employee_id = a.employee_id AND h.week_start = a.week_start
+"""
+REFRESH_INSERT = f"""
+    INSERT INTO tbc.hours_summary
+        (employee_id, week_start, work_area, shift_label, total_hours, shift_count)
+    {_SUM_SHIFTS}
+    JOIN ({_AFFECTED}) a
+      ON s.employee_id = a.employee_id
+     AND s.shift_date >= a.week_start AND s.shift_date < a.week_start + 7
+    {_SUM_GROUP}
+"""
+
+def rebuild(cursor):
+    """Recompute the whole summary; for repairs after edits made outside the app."""
+    cursor.execute("DELETE FROM tbc.hours_summary")
+    cursor.execute(f"""
+        INSERT INTO tbc.hours_summary
+            (employee_id, week_start, work_area, shift_label, total_hours, shift_count)
+        {_SUM_SHIFTS}
+        {_SUM_GROUP}
+    """)
+    return cursor.rowcount
+
+
+def refresh(cursor, shifts):
+    """Recompute the summary rows for the employee-weeks the given shifts fall in.
+
+    `shifts` is an iterable of (employee_id, shift_date) pairs (dates may be
+    ISO strings). Runs in the caller's transaction so the summary commits
+    together with the shifts that changed it. Concurrent refreshes of the same
+    employee-week queue on an advisory lock: each then re-sums after the other
+    has committed, rather than both inserting the same primary key.
+    """
+    employee_ids, shift_dates = [], []
+    for employee_id, shift_date in shifts:
+        employee_ids.append(int(employee_id))
+        shift_dates.append(shift_date)
+    if not employee_ids:
+        return 0
+    params = {"employee_ids": employee_ids, "shift_dates": shift_dates}
+    cursor.execute(_LOCK_AFFECTED, params)
+    cursor.execute(REFRESH_DELETE, params)
+    cursor.execute(REFRESH_INSERT, params)
+    return cursor.rowcount
+
+
+def period_start_sql(period):
+    # SQL expression mapping hs.week_start to the start of its pay period
+    if period == "weekly":
+        return "hs.week_start"
+    return "(%(anchor)s::date + 14 * floor((hs.week_start - %(anchor)s::date) / 14.0)::integer)"
+
+
+def period_start(period, day):
+    """Python twin of period_start_sql, used to widen from/to to whole periods."""
+    week_start = day - timedelta(days=day.weekday())
+    if period == "weekly":
+        return week_start
+    return PAY_PERIOD_ANCHOR + timedelta(days=14 * ((week_start - PAY_PERIOD_ANCHOR).days // 14))
+
+
+def build_query(args):
+    """Turn request args into (sql, params) for GET /api/hours-summary."""
+    period = args.get("period", "weekly")
+    if period not in PERIODS:
+        raise QueryParamError("'period' must be 'weekly' or 'biweekly'")
+    length = 7 if period == "weekly" else 14
+    params = {"anchor": PAY_PERIOD_ANCHOR, "length": length}
+    where = []
+    for name in ("from", "to", "employee_id"):
+        value = args.get(name)
+        if value in (None, ""):
+            continue
+        try:
+            value = int(value) if name == "employee_id" else date.fromisoformat(value)
+        except ValueError:
+            raise QueryParamError(f"invalid value for '{name}': {value}")
+        if name == "from":
+            # Whole periods only: start at the period containing `from`
+            where.append("hs.week_start >= %(from)s")
+            value = period_start(period, value)
+        elif name == "to":
+            where.append("hs.week_start <= %(to)s")
+        else:
+            where.append("hs.employee_id = %(employee_id)s")
+        params[name] = value
+    if "to" in params:
+        # ...and run to the end of the period containing `to`
+        params["to"] = period_start(period, params["to"]) + timedelta(days=length - 7)
+
+    start = period_start_sql(period)
+    sql = f"""
+        SELECT hs.employee_id, e.preferred_name,
+               {start} AS period_start,
+               {start} + %(length)s - 1 AS period_end,
+               NULLIF(hs.work_area, '') AS work_area,
+               NULLIF(hs.shift_label, '') AS shift_label,
+               SUM(hs.total_hours) AS total_hours,
+               SUM(hs.shift_count)::integer AS shift_count
+        FROM tbc.hours_summary hs
+        JOIN tbc.employees e ON e.id = hs.employee_id
+        {"WHERE " + " AND ".join(where) if where else ""}
+        GROUP BY hs.employee_id, e.preferred_name, 3, 4, hs.work_area, hs.shift_label
+        ORDER BY period_start, hs.employee_id, hs.work_area, hs.shift_label
+    """
+    return sql, params
@@ -0,0 +1,242 @@
+"""Versioned schema for the tbc tables the app reads and writes.
+
+Each migration runs once, in order, and is recorded in tbc.schema_migrations.
+Every step is written with IF NOT EXISTS, so the first run against the
+existing Supabase database only adds what is missing (the tables already
+exist there; the indexes and the newer tables may not).
+
+The app applies pending migrations lazily, the first time a request needs the
+schema (ensure_schema). To apply them ahead of a deploy:
+    DATABASE_URL=... python -m utils.migrations
+"""
+import os
+import sys
+import threading
+
+import psycopg2
+
+# Tables the app has always used. Only created on a fresh database (local
+# development, benchmarks); in Supabase they predate this module.
+BASE_TABLES = """
+    CREATE SCHEMA IF NOT EXISTS tbc;
+    CREATE TABLE IF NOT EXISTS tbc.employees (
+        id SERIAL PRIMARY KEY,
+        first_name TEXT NOT NULL,
+        preferred_name TEXT,
+        middle_name TEXT,
+        last_name TEXT,
+        role TEXT,
+        phone_number TEXT,
+        email TEXT,
+        start_date DATE,
+        end_date DATE,
+        is_active BOOLEAN NOT NULL DEFAULT TRUE,
+        position TEXT,
+        address TEXT
+    );
+    CREATE TABLE IF NOT EXISTS tbc.clover_employee_map (
+        employee_id INTEGER PRIMARY KEY REFERENCES tbc.employees(id),
+        clover_employee_id TEXT NOT NULL UNIQUE
+    );
+    CREATE TABLE IF NOT EXISTS tbc.shifts_dummy_20250719 (
+        id SERIAL PRIMARY KEY,
+        employee_id INTEGER NOT NULL REFERENCES tbc.employees(id),
+        shift_date DATE NOT NULL,
+        time_in TIME NOT NULL,
+        time_out TIME NOT NULL,
+        work_area TEXT,
+        shift_label TEXT,
+        decimal_hours NUMERIC(5, 2),
+        notes TEXT,
+        UNIQUE (employee_id, shift_date, time_in, time_out)
+    );
+    CREATE TABLE IF NOT EXISTS tbc.staged_shifts (
+        id SERIAL PRIMARY KEY,
+        employee_id INTEGER NOT NULL REFERENCES tbc.employees(id),
+        clover_shift_id TEXT,
+        shift_date DATE NOT NULL,
+        time_in TIME NOT NULL,
+        time_out TIME NOT NULL,
+        work_area TEXT,
+        shift_label TEXT,
+        decimal_hours NUMERIC(5, 2),
+        notes TEXT,
+        is_promoted BOOLEAN NOT NULL DEFAULT FALSE,
+        UNIQUE (employee_id, shift_date, time_in, time_out, clover_shift_id)
+    );
+"""
+
+# Per-Clover-employee sync watermark. last_synced_ms is the Clover in-time (epoch ms)
+# up to which every completed shift has been staged; the next sync asks Clover only
+# for shifts clocked in after it. last_modified_ms is the delta-sync high-water mark:
+# the newest Clover modifiedTime already staged. synced_at records when Clover was
+# last asked.
+#
+# Delta syncs also record each staged shift's Clover modifiedTime, and flag staged
+# rows that were already promoted when Clover changed them (needs_review).
+# staged_at is when a row was staged or last changed by a sync, for the ?since
+# filter of GET /api/staged-shifts.
+SYNC_STATE = """
+    CREATE TABLE IF NOT EXISTS tbc.sync_state (
+        clover_employee_id TEXT PRIMARY KEY,
+        employee_id INTEGER NOT NULL REFERENCES tbc.employees(id),
+        last_synced_ms BIGINT NOT NULL,
+        synced_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+    ALTER TABLE tbc.sync_state ADD COLUMN IF NOT EXISTS last_modified_ms BIGINT;
+    ALTER TABLE tbc.staged_shifts
+        ADD COLUMN IF NOT EXISTS clover_modified_ms BIGINT,
+        ADD COLUMN IF NOT EXISTS needs_review BOOLEAN NOT NULL DEFAULT FALSE,
+        ADD COLUMN IF NOT EXISTS staged_at TIMESTAMPTZ NOT NULL DEFAULT now();
+"""
+
+# One index per hot access path (benchmarks/explain_hot_queries.py checks the plans):
+# - MAX(shift_date) per employee (sync windows) and the per-employee range scans
+#   of /api/shifts, /api/shifts/export and hours_summary.refresh;
+# - the newest-first keyset walk of /api/shifts (shift_queries.SHIFTS_ORDER);
+# - the delta-sync upsert, keyed on clover_shift_id;
+# - the unpromoted review list, walked in day order or filtered on staged_at.
+#   Partial, so promoted history never bloats them.
+HOT_PATH_INDEXES = """
+    CREATE INDEX IF NOT EXISTS shifts_dummy_20250719_employee_date_idx
+        ON tbc.shifts_dummy_20250719 (employee_id, shift_date);
+    CREATE INDEX IF NOT EXISTS shifts_dummy_20250719_date_time_in_idx
+        ON tbc.shifts_dummy_20250719 (shift_date DESC, time_in, id);
+    CREATE INDEX IF NOT EXISTS staged_shifts_clover_shift_id_idx
+        ON tbc.staged_shifts (clover_shift_id);
+    CREATE INDEX IF NOT EXISTS staged_shifts_unpromoted_idx
+        ON tbc.staged_shifts (shift_date, time_in, id) WHERE NOT is_promoted;
+    CREATE INDEX IF NOT EXISTS staged_shifts_unpromoted_staged_at_idx
+        ON tbc.staged_shifts (staged_at) WHERE NOT is_promoted;
+"""
+
+# Hours per employee, week, work_area and shift_label, pre-summed from
+# tbc.shifts_dummy_20250719 (see utils/hours_summary.py). work_area/shift_label
+# are stored as '' when NULL so they can be part of the primary key.
+HOURS_SUMMARY = """
+    CREATE TABLE IF NOT EXISTS tbc.hours_summary (
+        employee_id INTEGER NOT NULL,
+        week_start DATE NOT NULL,
+        work_area TEXT NOT NULL DEFAULT '',
+        shift_label TEXT NOT NULL DEFAULT '',
+        total_hours NUMERIC(10, 2) NOT NULL,
+        shift_count INTEGER NOT NULL,
+        refreshed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        PRIMARY KEY (employee_id, week_start, work_area, shift_label)
+    );
+    CREATE INDEX IF NOT EXISTS hours_summary_week_start_idx ON tbc.hours_summary (week_start);
+"""
+
+
+# Promoted staged rows remember the shift they were promoted as, so a row that a
+# delta sync flagged needs_review can be re-promoted over that shift instead of
+# beside it. Rows promoted before this column existed are linked by their times;
+# rows already flagged have lost their old times and stay unlinked. The partial
+# index serves the ?review=true list of GET /api/staged-shifts.
+STAGED_REVIEW = """
+    ALTER TABLE tbc.staged_shifts
+        ADD COLUMN IF NOT EXISTS promoted_shift_id INTEGER
+            REFERENCES tbc.shifts_dummy_20250719(id) ON DELETE SET NULL;
+    UPDATE tbc.staged_shifts ss
+    SET promoted_shift_id = s.id
+    FROM tbc.shifts_dummy_20250719 s
+    WHERE ss.is_promoted AND NOT ss.needs_review AND ss.promoted_shift_id IS NULL
+      AND (s.employee_id, s.shift_date, s.time_in, s.time_out)
+          = (ss.employee_id, ss.shift_date, ss.time_in, ss.time_out);
+    CREATE INDEX IF NOT EXISTS staged_shifts_needs_review_idx
+        ON tbc.staged_shifts (shift_date, time_in, id) WHERE needs_review;
+"""
+
+
+# Window and delta syncs are throttled separately (CLOVER_SYNC_MIN_INTERVAL), so
+# each records its own last run: synced_at for window syncs, delta_synced_at for
+# delta syncs. A row first written by a delta sync has no window run yet.
+SYNC_STATE_PER_MODE = """
+    ALTER TABLE tbc.sync_state
+        ADD COLUMN IF NOT EXISTS delta_synced_at TIMESTAMPTZ,
+        ALTER COLUMN synced_at DROP NOT NULL;
+"""
+
+
+def create_hours_summary(cursor):
+    # Fill the summary from scratch the first time it is created
+    from utils import hours_summary
+
+    cursor.execute("SELECT to_regclass('tbc.hours_summary') IS NULL")
+    missing = cursor.fetchone()[0]
+    cursor.execute(HOURS_SUMMARY)
+    if missing:
+        hours_summary.rebuild(cursor)
+
+
+# (version, name, SQL or fn(cursor)); append only, never edit an applied step
+MIGRATIONS = [
+    (1, "base tables", BASE_TABLES),
+    (2, "sync state and staged shift tracking", SYNC_STATE),
+    (3, "hot path indexes", HOT_PATH_INDEXES),
+    (4, "hours summary", create_hours_summary),
+    (5, "staged shift review", STAGED_REVIEW),
+    (6, "per-mode sync times", SYNC_STATE_PER_MODE),
+]
+
+MIGRATIONS_TABLE = """
+    CREATE SCHEMA IF NOT EXISTS tbc;
+    CREATE TABLE IF NOT EXISTS tbc.schema_migrations (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+"""
+
+# Serialises migrators across gunicorn workers and deploys
+_LOCK_KEY = 0x7462_6331  # "tbc1"
+
+
+def migrate(conn):
+    """Apply pending migrations in one transaction; returns the versions applied."""
+    applied = []
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", (_LOCK_KEY,))
+        cursor.execute(MIGRATIONS_TABLE)
+        cursor.execute("SELECT version FROM tbc.schema_migrations")
+        done = {row[0] for row in cursor.fetchall()}
+        for version, name, step in MIGRATIONS:
+            if version in done:
+                continue
+            if callable(step):
+                step(cursor)
+            else:
+                cursor.execute(step)
+            cursor.execute("INSERT INTO tbc.schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+            applied.append(version)
+    conn.commit()
+    return applied
+
+
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+
+def ensure_schema(conn):
+    # Migrate once per process; later calls are a flag check
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if _schema_ready:
+            return
+        migrate(conn)
+        _schema_ready = True
+
+
+def main():
+    dsn = os.getenv("DATABASE_URL")
+    if not dsn:
+        sys.exit("Set DATABASE_URL")
+    with psycopg2.connect(dsn) as conn:
+        applied = migrate(conn)
+    print(f"Applied migrations {applied}" if applied else "Schema is up to date")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+from datetime import date, time
+from decimal import Decimal, InvalidOperation
+
+from psycopg2.extras import execute_values
+
+# Promote a batch of submitted shifts in one statement.
+#
+# Each posted row may reference a staged shift (staged_id); fields the client
+# sent override the staged values, anything left out comes from tbc.staged_shifts.
+# Rows without a staged_id are manual entries and must carry every key field.
+# A posted decimal_hours is kept as sent (a manager's correction); when it is
+# left out it is worked out from the final clock times (whole minutes, wrapping
+# past midnight, as the Clover import computes it), so neither a manual row nor
+# a staged row with edited times keeps hours that disagree with them.
+# Staged ids that are unknown or already promoted are reported, not re-inserted.
+# A promoted row that a delta sync flagged needs_review may be submitted again:
+# it then replaces the shift it was first promoted as (outcome "revised"), or is
+# inserted afresh if that shift is unknown. Repeats of the same (employee_id,
+# shift_date, time_in, time_out) inside the request are inserted once, and the
+# repeats report "duplicate" with the first one's shift_id. Staged rows whose
+# shift was inserted, revised, already existed or was a duplicate are marked
+# promoted (and reviewed) in the same statement, and one outcome row per posted
+# row comes back in request order.
+PROMOTE_SHIFTS = """
+    WITH posted (
+        idx, staged_id, employee_id, shift_date, time_in, time_out,
+        work_area, shift_label, decimal_hours, notes
+    ) AS (
+        VALUES %s
+    ),
+    source AS (
+        SELECT p.idx, p.staged_id, ss.id IS NOT NULL AS staged_found,
+               COALESCE(ss.is_promoted AND NOT ss.needs_review, FALSE) AS already_promoted,
+               CASE WHEN ss.needs_review THEN ss.promoted_shift_id END AS replaces,
+               COALESCE(p.employee_id, ss.employee_id) AS employee_id,
+               COALESCE(p.shift_date, ss.shift_date) AS shift_date,
+               t.time_in, t.time_out,
+               COALESCE(p.work_area, ss.work_area) AS work_area,
+               COALESCE(p.shift_label, ss.shift_label) AS shift_label,
+               COALESCE(p.decimal_hours, round(((floor(extract(epoch FROM t.time_out) / 60)
+                       - floor(extract(epoch FROM t.time_in) / 60) + 1440)::integer %% 1440) / 60.0, 2))
+                   AS decimal_hours,
+               COALESCE(p.notes, ss.notes) AS notes
+        FROM posted p
+        LEFT JOIN tbc.staged_shifts ss ON ss.id = p.staged_id
+        CROSS JOIN LATERAL (
+            SELECT COALESCE(p.time_in, ss.time_in) AS time_in, COALESCE(p.time_out, ss.time_out) AS time_out
+        ) t
+    ),
+    candidates AS (
+        SELECT DISTINCT ON (employee_id, shift_date, time_in, time_out) *
+        FROM source
+        WHERE staged_id IS NULL OR (staged_found AND NOT already_promoted)
+        ORDER BY employee_id, shift_date, time_in, time_out, idx
+    ),
+    -- The shifts being replaced, as they were before this statement
+    previous AS (
+        SELECT sh.id, sh.employee_id, sh.shift_date
+        FROM tbc.shifts_dummy_20250719 sh
+        JOIN candidates c ON sh.id = c.replaces
+    ),
+    revised AS (
+        UPDATE tbc.shifts_dummy_20250719 sh
+        SET employee_id = c.employee_id, shift_date = c.shift_date, time_in = c.time_in, time_out = c.time_out,
+            work_area = c.work_area, shift_label = c.shift_label,
+            decimal_hours = c.decimal_hours, notes = c.notes
+        FROM candidates c
+        WHERE sh.id = c.replaces
+          -- Moving onto another shift's times would break its unique key
+          AND NOT EXISTS (
+              SELECT 1 FROM tbc.shifts_dummy_20250719 o
+              WHERE (o.employee_id, o.shift_date, o.time_in, o.time_out)
+                    = (c.employee_id, c.shift_date, c.time_in, c.time_out)
+                AND o.id <> sh.id
+          )
+        RETURNING sh.id
+    ),
+    inserted AS (
+        INSERT INTO tbc.shifts_dummy_20250719 (
+            employee_id, shift_date, time_in, time_out, work_area,
+            shift_label, decimal_hours, notes
+        )
+        SELECT employee_id, shift_date, time_in, time_out, work_area,
+               shift_label, decimal_hours, notes
+        FROM candidates
+        WHERE replaces IS NULL OR replaces NOT IN (SELECT id FROM previous)
+        ON CONFLICT DO NOTHING
+        RETURNING id, employee_id, shift_date, time_in, time_out
+    ),
+    outcomes AS (
+        SELECT s.idx, s.staged_id, s.employee_id, s.shift_date, s.time_in, s.time_out,
+               COALESCE(r.id, i.id) AS shift_id, pr.employee_id AS previous_employee_id,
+               pr.shift_date AS previous_date,
+               CASE
+                   WHEN s.staged_id IS NOT NULL AND NOT s.staged_found THEN 'staged_not_found'
+                   WHEN s.already_promoted THEN 'already_promoted'
+                   WHEN c.idx <> s.idx THEN 'duplicate'
+                   WHEN r.id IS NOT NULL THEN 'revised'
+                   WHEN i.id IS NOT NULL THEN 'inserted'
+                   ELSE 'already_exists'
+               END AS outcome
+        FROM source s
+        -- The row inserted for s's key: s itself, or the first of its repeats
+        LEFT JOIN candidates c
+          ON (s.staged_id IS NULL OR (s.staged_found AND NOT s.already_promoted))
+         AND (c.employee_id, c.shift_date, c.time_in, c.time_out)
+             IS NOT DISTINCT FROM (s.employee_id, s.shift_date, s.time_in, s.time_out)
+        LEFT JOIN revised r ON c.idx IS NOT NULL AND r.id = c.replaces
+        LEFT JOIN previous pr ON pr.id = r.id
+        LEFT JOIN inserted i
+          ON c.idx IS NOT NULL
+         AND (i.employee_id, i.shift_date, i.time_in, i.time_out) = (c.employee_id, c.shift_date, c.time_in, c.time_out)
+    ),
+    promoted AS (
+        UPDATE tbc.staged_shifts ss
+        SET is_promoted = TRUE,
+            needs_review = FALSE,
+            promoted_shift_id = COALESCE(o.shift_id, (
+                SELECT sh.id FROM tbc.shifts_dummy_20250719 sh
+                WHERE (sh.employee_id, sh.shift_date, sh.time_in, sh.time_out)
+                      = (o.employee_id, o.shift_date, o.time_in, o.time_out)
+            ))
+        FROM outcomes o
+        WHERE ss.id = o.staged_id AND o.outcome IN ('inserted', 'revised', 'already_exists', 'duplicate')
+        RETURNING ss.id
+    )
+    SELECT o.idx, o.staged_id, o.employee_id, o.shift_date, o.shift_id, o.outcome,
+           o.staged_id IS NOT NULL AND o.staged_id IN (SELECT id FROM promoted) AS promoted,
+           o.previous_employee_id, o.previous_date
+    FROM outcomes o
+    ORDER BY o.idx
+"""
+PROMOTE_SHIFTS_TEMPLATE = (
+    "(%s::integer, %s::bigint, %s::integer, %s::date, %s::time, %s::time,"
+    " %s::text, %s::text, %s::numeric, %s::text)"
+)
+
+# Fields a posted row without a staged id must carry
+MANUAL_REQUIRED = ("employee_id", "shift_date", "time_in", "time_out")
+
+
+def _parse(field, value):
+    if value is None:
+        return None
+    if field in ("id", "employee_id"):
+        if isinstance(value, bool):
+            raise ValueError
+        return int(value)
+    if field == "shift_date":
+        return date.fromisoformat(str(value))
+    if field in ("time_in", "time_out"):
+        return time.fromisoformat(str(value))
+    if field == "decimal_hours":
+        return Decimal(str(value))
+    return str(value)
+
+
+def parse_submitted(shifts):
+    """Validate posted shifts; returns (rows for PROMOTE_SHIFTS, errors).
+
+    Every bad row is reported ({"index", "error"}) so the client can fix them
+    all at once; nothing is written if any row is bad.
+    """
+    rows, errors = [], []
+    fields = ("id", "employee_id", "shift_date", "time_in", "time_out",
+              "work_area", "shift_label", "decimal_hours", "notes")
+    for index, shift in enumerate(shifts):
+        if not isinstance(shift, dict):
+            errors.append({"index": index, "error": "expected an object"})
+            continue
+        values = {}
+        try:
+            for field in fields:
+                try:
+                    values[field] = _parse(field, shift.get(field))
+                except (TypeError, ValueError, InvalidOperation):
+                    raise ValueError(f"invalid {field}: {shift.get(field)!r}")
+            if values["id"] is None:
+                missing = [field for field in MANUAL_REQUIRED if values[field] is None]
+                if missing:
+                    raise ValueError(f"missing {', '.join(missing)} (required without a staged id)")
+        except ValueError as e:
+            errors.append({"index": index, "error": str(e)})
+            continue
+        rows.append((index,) + tuple(values[field] for field in fields))
+    return rows, errors
+
+
+def promote(cursor, rows):
+    """Run PROMOTE_SHIFTS for parsed rows; returns one outcome dict per row, in order."""
+    if not rows:
+        return []
+    result = execute_values(cursor, PROMOTE_SHIFTS, rows, template=PROMOTE_SHIFTS_TEMPLATE,
+                            page_size=len(rows), fetch=True)
+    return [
+        {
+            "index": idx,
+            "staged_id": staged_id,
+            "employee_id": employee_id,
+            "shift_date": shift_date,
+            "shift_id": shift_id,
+            "outcome": outcome,
+            "promoted": promoted,
+            # What a revised shift was before this re-promotion, else None
+            "previous_employee_id": previous_employee_id,
+            "previous_date": previous_date,
+        }
+        for (idx, staged_id, employee_id, shift_date, shift_id, outcome, promoted,
+             previous_employee_id, previous_date) in result
+    ]
@@ -0,0 +1,180 @@
+"""JSON encoding, ISO-string row casting and response compression.
+
+- ISO_TYPES / iso_cursor(): psycopg2 typecasters, registered per cursor, that
+  hand date/time/timestamp columns back as the ISO text Postgres already sent
+  instead of building Python objects only to isoformat() them again.
+- JSONProvider: Flask's JSON provider, encoding with orjson when it is
+  installed. Output is the same as the default provider's (sorted keys, dates
+  as HTTP dates, Decimal as a string); only the encoder is faster.
+- compress_response(): gzip or brotli (if installed) for sizeable JSON/CSV/text
+  responses, negotiated from Accept-Encoding. Streamed bodies are left alone.
+"""
+import gzip
+
+from flask.json.provider import DefaultJSONProvider
+from psycopg2.extensions import new_type, register_type
+
+from utils.cache import TTLCache
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the stdlib encoder
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+
+# --- Row casting ---
+
+def _iso_text(value, cursor):
+    return value
+
+
+def _iso_timestamp(value, cursor):
+    # '2025-07-20 12:00:00.5' -> '2025-07-20T12:00:00.5'
+    if value is None:
+        return None
+    return value.replace(" ", "T", 1)
+
+
+def _iso_timestamptz(value, cursor):
+    # '2025-07-20 12:00:00+00' -> '2025-07-20T12:00:00+00:00', as datetime.isoformat() writes it
+    if value is None or " " not in value:
+        return value  # NULL, infinity
+    value = value.replace(" ", "T", 1)
+    clock = value.index("T")
+    sign = max(value.rfind("+", clock), value.rfind("-", clock))
+    if sign != -1 and len(value) - sign == 3:
+        value += ":00"
+    return value
+
+
+# OIDs of date, time, timestamp and timestamptz; assumes the default DateStyle (ISO)
+ISO_TYPES = (
+    new_type((1082,), "ISO_DATE", _iso_text),
+    new_type((1083,), "ISO_TIME", _iso_text),
+    new_type((1114,), "ISO_TIMESTAMP", _iso_timestamp),
+    new_type((1184,), "ISO_TIMESTAMPTZ", _iso_timestamptz),
+)
+
+
+def register_iso_types(cursor):
+    for typ in ISO_TYPES:
+        register_type(typ, cursor)
+    return cursor
+
+
+def iso_cursor(conn, **kwargs):
+    """conn.cursor(**kwargs) returning dates, times and timestamps as ISO strings."""
+    return register_iso_types(conn.cursor(**kwargs))
+
+
+# --- JSON ---
+
+class JSONProvider(DefaultJSONProvider):
+    """DefaultJSONProvider with orjson doing the encoding when available."""
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return self._orjson_dumps(obj).decode()
+
+    def response(self, *args, **kwargs):
+        if orjson is None or self._app.debug:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self._orjson_dumps(obj) + b"\n", mimetype=self.mimetype)
+
+    def _orjson_dumps(self, obj):
+        # Dates go through the default hook so they keep Flask's format
+        option = orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(obj, default=self.default, option=option)
+        except TypeError:
+            # e.g. non-string dict keys or ints beyond 64 bits; the stdlib copes
+            return super().dumps(obj).encode()
+
+
+# --- Compression ---
+
+# Smaller bodies are not worth the CPU or the extra headers
+COMPRESS_MIN_BYTES = 1024
+COMPRESS_MIMETYPES = {"application/json", "text/csv", "text/plain", "text/html"}
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Compressed bodies of responses that carry an ETag (e.g. the cached employee
+# list), so an unchanged payload is only compressed once per encoding
+_compressed = TTLCache(ttl=3600, maxsize=64)
+
+
+def accepted_encodings(header):
+    """Codings from an Accept-Encoding header with a non-zero q, e.g. {"gzip", "br"}."""
+    codings = set()
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name and q > 0:
+            codings.add(name.strip().lower())
+    return codings
+
+
+def choose_encoding(header):
+    accepted = accepted_encodings(header)
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+def _compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+def compress_response(response, accept_encoding):
+    """Compress `response` in place when the client accepts it and it is worth it."""
+    if (response.status_code != 200
+            or response.direct_passthrough
+            or response.is_streamed
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESS_MIMETYPES):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = choose_encoding(accept_encoding)
+    if encoding is None:
+        return response
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return response
+
+    etag, weak = response.get_etag()
+    if etag:
+        key = (etag, encoding)
+        compressed = _compressed.get(key)
+        if compressed is None:
+            compressed = _compress(body, encoding)
+            _compressed.set(key, compressed)
+        # The bytes differ per encoding, so the validator can only be weak;
+        # If-None-Match still matches it (weak comparison)
+        response.set_etag(etag, weak=True)
+    else:
+        compressed = _compress(body, encoding)
+
+    response.set_data(compressed)
+    response.headers["Content-Encoding"] = encoding
+    return response
@@ -0,0 +1,143 @@
+import heapq
+import os
+from collections import defaultdict, namedtuple
+from datetime import datetime, timedelta
+
+# Pre-promotion checks on submitted shifts (rows from promotion.parse_submitted):
+#   overlap     the shift overlaps another submitted or already promoted shift
+#               of the same employee (e.g. a manual entry plus the Clover shift)
+#   duplicate   exactly the same times as another one; promotion skips these
+#   long_shift  longer than MAX_SHIFT_HOURS, usually a forgotten clock-out
+#   short_shift shorter than MIN_SHIFT_MINUTES, usually a double tap
+# Overlaps and long shifts block a submit until the client confirms them. A
+# flagged staged row submitted again replaces its promoted shift, so it is not
+# checked against that shift.
+MAX_SHIFT_HOURS = float(os.getenv("MAX_SHIFT_HOURS", "12"))
+MIN_SHIFT_MINUTES = float(os.getenv("MIN_SHIFT_MINUTES", "15"))
+BLOCKING = ("overlap", "long_shift")
+
+STAGED_FOR_CHECK = """
+    SELECT id, employee_id, shift_date, time_in, time_out,
+           CASE WHEN is_promoted AND needs_review THEN promoted_shift_id END
+    FROM tbc.staged_shifts
+    WHERE id = ANY(%(ids)s)
+"""
+
+# Promoted shifts that could touch the batch; a day either side catches
+# shifts that run past midnight
+EXISTING_FOR_CHECK = """
+    SELECT id, employee_id, shift_date, time_in, time_out
+    FROM tbc.shifts_dummy_20250719
+    WHERE employee_id = ANY(%(employee_ids)s)
+      AND shift_date BETWEEN %(from)s::date - 1 AND %(to)s::date + 1
+"""
+
+Interval = namedtuple("Interval", "start end employee_id shift_date time_in time_out index shift_id")
+
+
+def interval(employee_id, shift_date, time_in, time_out, index=None, shift_id=None):
+    start = datetime.combine(shift_date, time_in)
+    end = datetime.combine(shift_date, time_out)
+    if end < start:
+        # Clocked out after midnight
+        end += timedelta(days=1)
+    return Interval(start, end, employee_id, shift_date, time_in, time_out, index, shift_id)
+
+
+def _describe(iv):
+    described = {"shift_date": iv.shift_date.isoformat(), "time_in": iv.time_in.isoformat(),
+                 "time_out": iv.time_out.isoformat()}
+    if iv.index is not None:
+        described["index"] = iv.index
+    else:
+        described["shift_id"] = iv.shift_id
+    return described
+
+
+def _anomaly(kind, iv, **fields):
+    return {"type": kind, "employee_id": iv.employee_id, **_describe(iv), **fields}
+
+
+def find_overlaps(intervals):
+    """Overlapping pairs within one employee's intervals, via a sweep over start times.
+
+    Sorting is O(n log n); the heap holds the shifts still running at each
+    start, so the pass costs O(n log n + overlaps) rather than comparing every
+    pair. Pairs of two promoted shifts are history and are not reported.
+    """
+    found = []
+    running = []  # (end, seq, interval)
+    for seq, iv in enumerate(sorted(intervals, key=lambda iv: (iv.start, iv.end))):
+        while running and running[0][0] <= iv.start:
+            heapq.heappop(running)
+        for _, _, other in running:
+            if iv.index is None and other.index is None:
+                continue
+            # Report against the submitted row, pointing at the other shift
+            mine, theirs = (iv, other) if iv.index is not None else (other, iv)
+            kind = "duplicate" if (iv.start, iv.end) == (other.start, other.end) else "overlap"
+            found.append(_anomaly(kind, mine, other=_describe(theirs)))
+        heapq.heappush(running, (iv.end, seq, iv))
+    return found
+
+
+def resolve(cursor, rows):
+    """Submitted rows as intervals, filling fields left out from their staged row.
+
+    Returns (intervals, ids of the promoted shifts that re-promoted rows replace).
+    """
+    staged_ids = [row[1] for row in rows if row[1] is not None]
+    staged = {}
+    if staged_ids:
+        cursor.execute(STAGED_FOR_CHECK, {"ids": staged_ids})
+        staged = {r[0]: r[1:] for r in cursor.fetchall()}
+    replaced = {fields[4] for fields in staged.values() if fields[4] is not None}
+    intervals = []
+    for index, staged_id, *values in rows:
+        employee_id, shift_date, time_in, time_out = values[:4]
+        if staged_id in staged:
+            fallback = staged[staged_id][:4]
+            employee_id, shift_date, time_in, time_out = (
+                value if value is not None else default
+                for value, default in zip((employee_id, shift_date, time_in, time_out), fallback)
+            )
+        if None in (employee_id, shift_date, time_in, time_out):
+            continue  # unknown staged id; promotion reports it
+        intervals.append(interval(employee_id, shift_date, time_in, time_out, index=index))
+    return intervals, replaced
+
+
+def check(cursor, rows):
+    """Anomalies for parsed rows against each other and the promoted shifts; read-only."""
+    incoming, replaced = resolve(cursor, rows)
+    if not incoming:
+        return []
+    by_employee = defaultdict(list)
+    for iv in incoming:
+        by_employee[iv.employee_id].append(iv)
+
+    cursor.execute(EXISTING_FOR_CHECK, {
+        "employee_ids": list(by_employee),
+        "from": min(iv.shift_date for iv in incoming),
+        "to": max(iv.shift_date for iv in incoming),
+    })
+    for shift_id, employee_id, shift_date, time_in, time_out in cursor.fetchall():
+        if shift_id in replaced:
+            continue
+        by_employee[employee_id].append(interval(employee_id, shift_date, time_in, time_out, shift_id=shift_id))
+
+    anomalies = []
+    for iv in incoming:
+        hours = (iv.end - iv.start).total_seconds() / 3600
+        if hours > MAX_SHIFT_HOURS:
+            anomalies.append(_anomaly("long_shift", iv, hours=round(hours, 2)))
+        elif hours * 60 < MIN_SHIFT_MINUTES:
+            anomalies.append(_anomaly("short_shift", iv, hours=round(hours, 2)))
+    for intervals in by_employee.values():
+        anomalies.extend(find_overlaps(intervals))
+    anomalies.sort(key=lambda a: (a["index"], a["type"]))
+    return anomalies
+
+
+def blocking(anomalies):
+    return [a for a in anomalies if a["type"] in BLOCKING]
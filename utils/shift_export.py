@@ -0,0 +1,119 @@
+import csv
+import io
+import tempfile
+from decimal import Decimal
+
+# Same column layout as tbc_timesheet.csv
+EXPORT_COLUMNS = ["employee_id", "shift_date", "time_in", "time_out", "work_area", "shift_label", "decimal_hours", "notes"]
+
+# Grouped by employee, then chronological, like the payroll sheet
+EXPORT_SELECT = """
+    SELECT s.employee_id, s.shift_date, s.time_in, s.time_out, s.work_area,
+           s.shift_label, s.decimal_hours, s.notes
+    FROM tbc.shifts_dummy_20250719 s
+"""
+EXPORT_ORDER = "ORDER BY s.employee_id, s.shift_date, s.time_in, s.id"
+
+CSV_CHUNK_SIZE = 64 * 1024
+
+
+def build_export_query(where, params):
+    sql = EXPORT_SELECT
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return sql + " " + EXPORT_ORDER, params
+
+
+def with_subtotals(rows):
+    """Pass rows through, adding a subtotal row after each employee's shifts.
+
+    Rows must arrive grouped by employee_id (EXPORT_ORDER guarantees it).
+    """
+    current = None
+    total = Decimal("0")
+    for row in rows:
+        if current is not None and row[0] != current:
+            yield subtotal_row(current, total)
+            total = Decimal("0")
+        current = row[0]
+        total += Decimal(row[6] or 0)
+        yield row
+    if current is not None:
+        yield subtotal_row(current, total)
+
+
+def subtotal_row(employee_id, total):
+    return (employee_id, None, None, None, None, None, total, "Subtotal")
+
+
+def format_date(value):
+    # 7/7/2023, as in tbc_timesheet.csv
+    return f"{value.month}/{value.day}/{value.year}" if value else ""
+
+
+def format_time(value):
+    # 5:00:00 PM, as in tbc_timesheet.csv
+    if value is None:
+        return ""
+    hour = value.hour % 12 or 12
+    return f"{hour}:{value.minute:02d}:{value.second:02d} {'AM' if value.hour < 12 else 'PM'}"
+
+
+def format_csv_row(row):
+    employee_id, shift_date, time_in, time_out, work_area, shift_label, decimal_hours, notes = row
+    return [
+        employee_id,
+        format_date(shift_date),
+        format_time(time_in),
+        format_time(time_out),
+        work_area or "",
+        shift_label or "",
+        "" if decimal_hours is None else f"{decimal_hours:.2f}",
+        notes or "",
+    ]
+
+
+def iter_csv(rows):
+    """Render rows as CSV text in ~64 KB chunks for a streamed response."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\r\n")
+    # BOM so Excel opens the file as UTF-8, like the original export
+    buffer.write("\ufeff")
+    writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        writer.writerow(format_csv_row(row))
+        if buffer.tell() >= CSV_CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def write_xlsx(rows):
+    """Write rows to an .xlsx in a spooled temp file and return it rewound.
+
+    openpyxl's write-only mode flushes rows to disk as they come, and the
+    finished file spills out of memory past a few MB.
+    """
+    import openpyxl
+
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet("shifts")
+    sheet.append(EXPORT_COLUMNS)
+    for row in rows:
+        sheet.append([float(v) if isinstance(v, Decimal) else v for v in row])
+    out = tempfile.SpooledTemporaryFile(max_size=4 * 1024 * 1024)
+    workbook.save(out)
+    out.seek(0)
+    return out
+
+
+def iter_file(f, chunk_size=CSV_CHUNK_SIZE):
+    try:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        f.close()
@@ -0,0 +1,164 @@
+import bisect
+import threading
+import zoneinfo
+from datetime import date, datetime, time, timezone
+
+PACIFIC = zoneinfo.ZoneInfo("America/Los_Angeles")
+
+# Shift label boundaries, as minutes after local midnight
+LUNCH_CUTOFF = 14 * 60 + 30   # clock-in before 14:30 -> Lunch
+BREAK_CUTOFF = 17 * 60        # clock-in before 17:00 -> Break, otherwise Dinner
+LUNCH_CUTOFF_TIME = time(14, 30)
+BREAK_CUTOFF_TIME = time(17, 0)
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+_SECONDS_PER_YEAR = 31556952
+
+
+def determine_shift_label(time_obj):
+    if time_obj < LUNCH_CUTOFF_TIME:
+        return "Lunch"
+    elif time_obj < BREAK_CUTOFF_TIME:
+        return "Break"
+    else:
+        return "Dinner"
+
+
+def _label_for_minute(minute_of_day):
+    if minute_of_day < LUNCH_CUTOFF:
+        return "Lunch"
+    elif minute_of_day < BREAK_CUTOFF:
+        return "Break"
+    return "Dinner"
+
+
+class OffsetTable:
+    """UTC offsets of a time zone as a sorted list of transition instants.
+
+    Transitions are found once per calendar year (a dozen monthly probes plus a
+    binary search around each DST change) and cached. Converting a batch of
+    epochs then costs one bisect each instead of a datetime.fromtimestamp().
+    """
+
+    def __init__(self, tz):
+        self.tz = tz
+        # (years loaded, epoch seconds where an offset takes effect ascending, offset
+        # in seconds from that instant on). Replaced whole, never mutated, so readers
+        # need no lock and always see starts and offsets that belong together.
+        self._table = (frozenset(), [], [])
+        self._lock = threading.Lock()
+
+    def _offset_at(self, epoch_s):
+        return int(datetime.fromtimestamp(epoch_s, tz=self.tz).utcoffset().total_seconds())
+
+    def _load_year(self, year):
+        probes = [int(datetime(year, month, 1, tzinfo=timezone.utc).timestamp()) for month in range(1, 13)]
+        probes.append(int(datetime(year + 1, 1, 1, tzinfo=timezone.utc).timestamp()))
+        segments = [(probes[0], self._offset_at(probes[0]))]
+        for lo, hi in zip(probes, probes[1:]):
+            lo_offset = self._offset_at(lo)
+            if self._offset_at(hi) == lo_offset:
+                continue
+            # First second in (lo, hi] that has the new offset
+            while hi - lo > 1:
+                mid = (lo + hi) // 2
+                if self._offset_at(mid) == lo_offset:
+                    lo = mid
+                else:
+                    hi = mid
+            segments.append((hi, self._offset_at(hi)))
+        return segments
+
+    def _ensure_years(self, years):
+        """The table, extended first if any of `years` is missing from it."""
+        table = self._table
+        if all(y in table[0] for y in years):
+            return table
+        with self._lock:
+            loaded, starts, offsets = self._table
+            merged = dict(zip(starts, offsets))
+            for year in years:
+                if year not in loaded:
+                    merged.update(self._load_year(year))
+            starts = sorted(merged)
+            self._table = table = (loaded.union(years), starts, [merged[s] for s in starts])
+        return table
+
+    def offsets(self, epochs_s):
+        """UTC offsets (seconds) for a batch of epoch seconds."""
+        if not epochs_s:
+            return []
+        lo_year = 1970 + min(epochs_s) // _SECONDS_PER_YEAR
+        hi_year = 1970 + max(epochs_s) // _SECONDS_PER_YEAR
+        _, starts, offsets = self._ensure_years(range(lo_year - 1, hi_year + 2))
+        return [offsets[bisect.bisect_right(starts, e) - 1] for e in epochs_s]
+
+
+PACIFIC_OFFSETS = OffsetTable(PACIFIC)
+
+
+def normalize_batch(in_ms, out_ms, offsets=PACIFIC_OFFSETS):
+    """Normalize parallel lists of clock-in/clock-out epoch milliseconds.
+
+    Returns a dict of equal-length columns: shift_date (date), time_in and
+    time_out ("HH:MM:00", local), shift_label and decimal_hours. Times are
+    truncated to the minute like the Clover import always has; hours are the
+    elapsed minutes between those stamps, so shifts crossing midnight (or a
+    DST change) come out right.
+    """
+    in_s = [ms // 1000 for ms in in_ms]
+    out_s = [ms // 1000 for ms in out_ms]
+    in_local = [s + o for s, o in zip(in_s, offsets.offsets(in_s))]
+    out_local = [s + o for s, o in zip(out_s, offsets.offsets(out_s))]
+
+    shift_date = [date.fromordinal(_EPOCH_ORDINAL + s // 86400) for s in in_local]
+    in_minute = [(s % 86400) // 60 for s in in_local]
+    out_minute = [(s % 86400) // 60 for s in out_local]
+
+    return {
+        "shift_date": shift_date,
+        "time_in": [f"{m // 60:02d}:{m % 60:02d}:00" for m in in_minute],
+        "time_out": [f"{m // 60:02d}:{m % 60:02d}:00" for m in out_minute],
+        "shift_label": [_label_for_minute(m) for m in in_minute],
+        "decimal_hours": [round((o // 60 - i // 60) / 60, 2) for i, o in zip(in_s, out_s)],
+    }
+
+
+def shift_times(shift):
+    # Manager overrides win over the raw punch times
+    in_ms = shift.get("overrideInTime") or shift.get("inTime")
+    out_ms = shift.get("overrideOutTime") or shift.get("outTime")
+    return in_ms, out_ms
+
+
+def normalize_clover_shifts(shifts):
+    """Normalize a page of raw Clover shift objects.
+
+    Returns (rows, skipped): one dict per complete shift with clover_shift_id,
+    shift_date, time_in, time_out, shift_label and decimal_hours, plus the
+    number of shifts dropped for lacking an in or out time.
+    """
+    ids, in_ms, out_ms = [], [], []
+    skipped = 0
+    for shift in shifts:
+        shift_in, shift_out = shift_times(shift)
+        if not shift_in or not shift_out:
+            skipped += 1
+            continue
+        ids.append(shift.get("id"))
+        in_ms.append(int(shift_in))
+        out_ms.append(int(shift_out))
+
+    columns = normalize_batch(in_ms, out_ms)
+    rows = [
+        {
+            "clover_shift_id": ids[i],
+            "shift_date": columns["shift_date"][i],
+            "time_in": columns["time_in"][i],
+            "time_out": columns["time_out"][i],
+            "shift_label": columns["shift_label"][i],
+            "decimal_hours": columns["decimal_hours"][i],
+        }
+        for i in range(len(ids))
+    ]
+    return rows, skipped
@@ -0,0 +1,120 @@
+import base64
+import binascii
+import json
+from datetime import date, time
+
+# Query-string filters accepted by GET /api/shifts and the SQL they map to
+SHIFT_FILTERS = {
+    "from": "s.shift_date >= %(from)s",
+    "to": "s.shift_date <= %(to)s",
+    "employee_id": "s.employee_id = %(employee_id)s",
+    "work_area": "s.work_area = %(work_area)s",
+    "shift_label": "s.shift_label = %(shift_label)s",
+}
+
+SHIFT_COLUMNS = ["id", "shift_date", "employee_id", "preferred_name", "time_in", "time_out",
+                 "work_area", "shift_label", "decimal_hours", "notes"]
+
+SHIFTS_SELECT = """
+    SELECT
+        s.id,
+        s.shift_date,
+        s.employee_id,
+        e.preferred_name,
+        s.time_in,
+        s.time_out,
+        s.work_area,
+        s.shift_label,
+        s.decimal_hours,
+        s.notes
+    FROM tbc.shifts_dummy_20250719 s
+    JOIN tbc.employees e ON s.employee_id = e.id
+"""
+
+# Newest days first, then by clock-in; id breaks ties so the keyset is unique
+SHIFTS_ORDER = "ORDER BY s.shift_date DESC, s.time_in ASC, s.id ASC"
+
+# Keyset predicate for that mixed-direction ordering: rows strictly after the cursor
+SHIFTS_AFTER = """(
+    s.shift_date < %(after_date)s
+    OR (s.shift_date = %(after_date)s AND (s.time_in, s.id) > (%(after_time)s, %(after_id)s))
+)"""
+
+MAX_PAGE_SIZE = 1000
+
+
+class QueryParamError(ValueError):
+    """Bad query-string input; reported to the client as a 400."""
+
+
+def parse_filters(args):
+    """Turn request args into (where clauses, params) for SHIFTS_SELECT."""
+    where = []
+    params = {}
+    for name, clause in SHIFT_FILTERS.items():
+        value = args.get(name)
+        if value in (None, ""):
+            continue
+        try:
+            if name in ("from", "to"):
+                value = date.fromisoformat(value)
+            elif name == "employee_id":
+                value = int(value)
+        except ValueError:
+            raise QueryParamError(f"invalid value for '{name}': {value}")
+        where.append(clause)
+        params[name] = value
+    return where, params
+
+
+def parse_limit(value, default=100):
+    if value in (None, ""):
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise QueryParamError(f"invalid value for 'limit': {value}")
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise QueryParamError(f"'limit' must be between 1 and {MAX_PAGE_SIZE}")
+    return limit
+
+
+def encode_cursor(record):
+    # Opaque to clients: base64 of the (shift_date, time_in, id) keyset of the last row
+    key = [str(record["shift_date"]), str(record["time_in"]), record["id"]]
+    return base64.urlsafe_b64encode(json.dumps(key, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        shift_date, time_in, shift_id = json.loads(base64.urlsafe_b64decode(padded))
+        return {
+            "after_date": date.fromisoformat(shift_date),
+            "after_time": time.fromisoformat(time_in),
+            "after_id": int(shift_id),
+        }
+    except (binascii.Error, ValueError, TypeError):
+        raise QueryParamError("invalid cursor")
+
+
+def build_query(where, params, after=None, limit=None):
+    where = list(where)
+    params = dict(params)
+    if after:
+        where.append(SHIFTS_AFTER)
+        params.update(after)
+    sql = SHIFTS_SELECT
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " " + SHIFTS_ORDER
+    if limit is not None:
+        sql += " LIMIT %(limit)s"
+        params["limit"] = limit
+    return sql, params
+
+
+def shift_record(columns, row):
+    # Rows come from a cursor with serialization.ISO_TYPES registered, so dates and
+    # times are already strings: shift_date → "2023-07-07", time_in → "17:00:00"
+    return dict(zip(columns, row))
@@ -0,0 +1,109 @@
+import base64
+import binascii
+import json
+import os
+from datetime import date, datetime, time, timedelta
+
+from utils.shift_queries import QueryParamError
+
+# The review list: staged shifts not promoted yet, oldest day first. Both the
+# keyset walk and the ?since filter are served by partial indexes on unpromoted
+# rows (see migrations.HOT_PATH_INDEXES), so promoted history never gets scanned.
+# With review=True it lists promoted rows that Clover changed afterwards instead
+# (needs_review); promoted_shift_id is the shift that re-promoting them replaces.
+STAGED_COLUMNS = ["id", "employee_id", "preferred_name", "clover_shift_id", "shift_date", "time_in",
+                  "time_out", "work_area", "shift_label", "decimal_hours", "notes", "staged_at",
+                  "needs_review", "promoted_shift_id"]
+
+STAGED_SELECT = """
+    SELECT
+        ss.id,
+        ss.employee_id,
+        e.preferred_name,
+        ss.clover_shift_id,
+        ss.shift_date,
+        ss.time_in,
+        ss.time_out,
+        ss.work_area,
+        ss.shift_label,
+        ss.decimal_hours,
+        ss.notes,
+        ss.staged_at,
+        ss.needs_review,
+        ss.promoted_shift_id
+    FROM tbc.staged_shifts ss
+    JOIN tbc.employees e ON ss.employee_id = e.id
+"""
+STAGED_UNPROMOTED = "WHERE NOT ss.is_promoted"
+STAGED_NEEDS_REVIEW = "WHERE ss.is_promoted AND ss.needs_review"
+
+STAGED_ORDER = "ORDER BY ss.shift_date, ss.time_in, ss.id"
+STAGED_AFTER = "(ss.shift_date, ss.time_in, ss.id) > (%(after_date)s, %(after_time)s, %(after_id)s)"
+
+# staged_at is the staging transaction's start time, so a sync that commits while
+# a client reads can land rows slightly before that read's as_of. ?since looks
+# back this far to catch them; the repeats it returns are merged by id.
+SINCE_OVERLAP = timedelta(seconds=int(os.getenv("STAGED_SINCE_OVERLAP_SECONDS", "300")))
+
+
+def _encode(value):
+    return base64.urlsafe_b64encode(json.dumps(value, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def _decode(token):
+    padded = token + "=" * (-len(token) % 4)
+    return json.loads(base64.urlsafe_b64decode(padded))
+
+
+def encode_since(as_of):
+    return _encode(as_of.isoformat())
+
+
+def decode_since(token):
+    try:
+        as_of = datetime.fromisoformat(_decode(token))
+    except (binascii.Error, ValueError, TypeError):
+        raise QueryParamError("invalid since token")
+    if as_of.tzinfo is None:
+        raise QueryParamError("invalid since token")
+    return as_of
+
+
+def encode_cursor(record, as_of):
+    # The (shift_date, time_in, id) keyset of the last row plus the walk's as_of,
+    # so every page of one walk hands back the same next_since
+    return _encode([str(record["shift_date"]), str(record["time_in"]), record["id"], as_of.isoformat()])
+
+
+def decode_cursor(token):
+    try:
+        shift_date, time_in, staged_id, as_of = _decode(token)
+        after = {
+            "after_date": date.fromisoformat(shift_date),
+            "after_time": time.fromisoformat(time_in),
+            "after_id": int(staged_id),
+        }
+        return after, datetime.fromisoformat(as_of)
+    except (binascii.Error, ValueError, TypeError):
+        raise QueryParamError("invalid cursor")
+
+
+def build_query(since=None, after=None, limit=100, review=False):
+    where = []
+    params = {"limit": limit}
+    if since is not None:
+        where.append("ss.staged_at > %(since)s")
+        params["since"] = since - SINCE_OVERLAP
+    if after:
+        where.append(STAGED_AFTER)
+        params.update(after)
+    sql = STAGED_SELECT + (STAGED_NEEDS_REVIEW if review else STAGED_UNPROMOTED)
+    for clause in where:
+        sql += " AND " + clause
+    sql += " " + STAGED_ORDER + " LIMIT %(limit)s"
+    return sql, params
+
+
+def staged_record(columns, row):
+    # Dates, times and staged_at arrive as ISO strings (serialization.iso_cursor)
+    return dict(zip(columns, row))
@@ -0,0 +1,129 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.metrics import log_event
+
+# Jobs stay pollable this long after they finish
+FINISHED_JOB_TTL = 3600
+
+
+class SyncJob:
+    """Progress of one background sync, safe to read while the job runs."""
+
+    def __init__(self, key, params=None):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.params = params or {}
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.error = None
+        self.employees = {}  # employee_id -> progress dict, in sync order
+        self.totals = {"imported": 0, "updated": 0, "flagged": 0, "skipped": 0, "up_to_date": 0, "failed": 0}
+        self._lock = threading.Lock()
+
+    def add_employee(self, employee_id, name, status="pending"):
+        with self._lock:
+            self.employees[employee_id] = {
+                "employee_id": employee_id,
+                "preferred_name": name,
+                "status": status,
+                "imported": 0,
+                "updated": 0,
+                "flagged": 0,
+                "skipped": 0,
+                "error": None,
+            }
+            if status == "up_to_date":
+                self.totals["up_to_date"] += 1
+
+    def update_employee(self, employee_id, **fields):
+        with self._lock:
+            self.employees[employee_id].update(fields)
+
+    def finish_employee(self, employee_id, error=None, **counts):
+        # counts: imported / updated / flagged / skipped for this employee
+        with self._lock:
+            entry = self.employees[employee_id]
+            entry.update(counts, error=error, status="failed" if error else "done")
+            if error:
+                self.totals["failed"] += 1
+            else:
+                for key, count in counts.items():
+                    self.totals[key] += count
+
+    def to_dict(self):
+        with self._lock:
+            employees = [dict(e) for e in self.employees.values()]
+            finished = sum(1 for e in employees if e["status"] in ("done", "failed", "up_to_date"))
+            return {
+                "job_id": self.id,
+                "status": self.status,
+                "params": self.params,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "error": self.error,
+                "progress": {"employees_total": len(employees), "employees_finished": finished},
+                **self.totals,
+                "errors": [{"employee_id": e["employee_id"], "error": e["error"]} for e in employees if e["error"]],
+                "employees": employees,
+            }
+
+
+class JobRunner:
+    """Runs sync jobs on a background thread and keeps their status for polling.
+
+    A submission whose key matches a job that is still queued or running gets
+    that job back instead of starting a second one. Jobs live in this process
+    only, which is fine with the single gunicorn worker in the Procfile; with
+    more workers a poll has to reach the worker that took the job.
+    """
+
+    def __init__(self, max_workers=1, finished_ttl=FINISHED_JOB_TTL):
+        self.finished_ttl = finished_ttl
+        self._jobs = {}
+        self._active = {}  # key -> job id
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sync-job")
+
+    def submit(self, key, fn, params=None):
+        """Queue fn(job) unless an equal job is active; returns (job, created)."""
+        with self._lock:
+            self._prune()
+            active_id = self._active.get(key)
+            if active_id is not None:
+                return self._jobs[active_id], False
+            job = SyncJob(key, params)
+            self._jobs[job.id] = job
+            self._active[key] = job.id
+        self._executor.submit(self._run, job, fn)
+        return job, True
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job, fn):
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            fn(job)
+            job.status = "succeeded"
+        except Exception as e:
+            log_event("sync_job.failed", level="error", job_id=job.id, error=str(e))
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                if self._active.get(job.key) == job.id:
+                    del self._active[job.key]
+
+    def _prune(self):
+        cutoff = time.time() - self.finished_ttl
+        for job_id in [j.id for j in self._jobs.values() if j.finished_at and j.finished_at < cutoff]:
+            del self._jobs[job_id]
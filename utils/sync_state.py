@@ -0,0 +1,53 @@
+# Per-Clover-employee sync watermarks live in tbc.sync_state (created by
+# utils/migrations.py): last_synced_ms for window syncs, last_modified_ms for
+# delta syncs.
+
+
+def advance(cursor, clover_emp_id, employee_id, last_synced_ms, last_modified_ms=None, mode="window"):
+    """Move an employee's watermarks forward (never back) in the caller's transaction.
+
+    `mode` ("window" or "delta") picks the sync time to stamp: each mode keeps its
+    own, so a run of one never makes the other skip the employee as up to date.
+    """
+    synced_at = "delta_synced_at" if mode == "delta" else "synced_at"
+    cursor.execute(f"""
+        INSERT INTO tbc.sync_state (clover_employee_id, employee_id, last_synced_ms, last_modified_ms, {synced_at})
+        VALUES (%s, %s, %s, %s, now())
+        ON CONFLICT (clover_employee_id) DO UPDATE
+        SET employee_id = EXCLUDED.employee_id,
+            last_synced_ms = GREATEST(tbc.sync_state.last_synced_ms, EXCLUDED.last_synced_ms),
+            last_modified_ms = GREATEST(tbc.sync_state.last_modified_ms, EXCLUDED.last_modified_ms),
+            {synced_at} = now()
+    """, (clover_emp_id, employee_id, last_synced_ms, last_modified_ms))
+
+
+class WatermarkTracker:
+    """Work out where the next sync should start from the shifts seen in this one.
+
+    The watermark moves to the latest completed shift's in-time, but never past
+    a shift that is still open (clocked in, not yet out), so that shift is
+    fetched again once it has been closed.
+    """
+
+    def __init__(self, start_ms):
+        self.start_ms = start_ms
+        self.max_complete_ms = None
+        self.min_open_ms = None
+
+    def add(self, in_ms, out_ms):
+        if not in_ms:
+            return
+        if out_ms:
+            if self.max_complete_ms is None or in_ms > self.max_complete_ms:
+                self.max_complete_ms = in_ms
+        elif self.min_open_ms is None or in_ms < self.min_open_ms:
+            self.min_open_ms = in_ms
+
+    def watermark(self):
+        mark = self.start_ms
+        if self.max_complete_ms is not None:
+            mark = max(mark, self.max_complete_ms)
+        if self.min_open_ms is not None:
+            # Clover's in_and_override_time filter is exclusive
+            mark = min(mark, self.min_open_ms - 1)
+        return max(mark, self.start_ms)